@@ -1,47 +1,115 @@
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
 from matplotlib.patches import Patch
 import numpy as np
 import csv
-import json
+import sys
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from json_tools import read_json, write_json, get_expanded_instance
 
-def get_total_window_number(instance):
-    
-    window_number = 0
 
-    for patient in instance['patients'].values():
-        for protocol in patient['protocols'].values():
+def get_windows_table(instance):
+
+    # all the request windows of the instance are unrolled once, one for each
+    # protocol service repetition, in a table of numpy arrays. This does not
+    # reuse the checkers windows index: that one is a per-request sorted list
+    # made for day lookups, while metrics here are computed on whole columns
+    patient_names = sorted(instance['patients'].keys())
+    service_names = sorted(instance['services'].keys())
+
+    care_unit_names = set()
+    for day in instance['days'].values():
+        care_unit_names.update(day.keys())
+    care_unit_names = sorted(care_unit_names)
+
+    service_indexes = {service_name: index for index, service_name in enumerate(service_names)}
+    care_unit_indexes = {care_unit_name: index for index, care_unit_name in enumerate(care_unit_names)}
+
+    # one row for each protocol service, expanded later on its repetitions
+    patients = []
+    services = []
+    care_units = []
+    durations = []
+    starts = []
+    tolerances = []
+    frequencies = []
+    times = []
+
+    for patient_index, patient_name in enumerate(patient_names):
+        for protocol in instance['patients'][patient_name]['protocols'].values():
 
             initial_shift = protocol['initial_shift']
             
             for protocol_service in protocol['protocol_services']:
 
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
+                service_name = protocol_service['service']
+                service = instance['services'][service_name]
+
+                patients.append(patient_index)
+                services.append(service_indexes[service_name])
+                # care units not offered in any day have index -1
+                care_units.append(care_unit_indexes.get(service['care_unit'], -1))
+                durations.append(service['duration'])
+                starts.append(protocol_service['start'] + initial_shift)
+                tolerances.append(protocol_service['tolerance'])
+                frequencies.append(protocol_service['frequency'])
+                times.append(protocol_service['times'])
+
+    times = np.array(times, dtype=int)
+    window_number = int(times.sum())
+
+    # position of each window inside its own protocol service repetitions
+    repetitions = np.arange(window_number) - np.repeat(np.cumsum(times) - times, times)
+    centers = np.repeat(np.array(starts, dtype=int), times) + np.repeat(np.array(frequencies, dtype=int), times) * repetitions
+    tolerances = np.repeat(np.array(tolerances, dtype=int), times)
+
+    return {
+        'patient_names': patient_names,
+        'service_names': service_names,
+        'care_unit_names': care_unit_names,
+        'day_indexes': np.array(sorted(int(day_name) for day_name in instance['days'].keys()), dtype=int),
+        'patient': np.repeat(np.array(patients, dtype=int), times),
+        'service': np.repeat(np.array(services, dtype=int), times),
+        'care_unit': np.repeat(np.array(care_units, dtype=int), times),
+        'duration': np.repeat(np.array(durations, dtype=int), times),
+        'tolerance': tolerances,
+        # first and last day of each window, both included
+        'start': centers - tolerances,
+        'end': centers + tolerances
+    }
 
-                for central_day_index in range(start, start + frequency * times, frequency):
 
-                    is_window_inside = False
+def get_windows_day_positions(windows_table):
 
-                    for day_index in range(central_day_index - tolerance, central_day_index + tolerance + 1):
+    # each window covers the days in positions [first; last) of 'day_indexes'
+    first_positions = np.searchsorted(windows_table['day_indexes'], windows_table['start'], side='left')
+    last_positions = np.searchsorted(windows_table['day_indexes'], windows_table['end'], side='right')
 
-                        day_name = str(day_index)
+    return first_positions, last_positions
 
-                        if day_name in instance['days']:
-                            is_window_inside = True
-                            break
-                    
-                    if is_window_inside:
-                        window_number += 1
-        
-    return window_number
 
+def get_total_window_number(instance, windows_table=None):
+    
+    # the table can be built once and shared between metrics
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
+
+    # only windows with at least a day in the instance are counted
+    first_positions, last_positions = get_windows_day_positions(windows_table)
 
-def get_normalized_disponibility_vs_requests(instance):
+    return int(np.count_nonzero(first_positions < last_positions))
+
+
+def get_normalized_disponibility_vs_requests(instance, windows_table=None):
+
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
 
     days_disponibility = {}
 
@@ -53,45 +121,26 @@ def get_normalized_disponibility_vs_requests(instance):
             for operator in care_unit.values():
                 days_disponibility[day_name] += operator['duration']
 
-    worst_case_request_scenario = {day_name: 0 for day_name in instance['days'].keys()}
-    tolerance_sum = 0
-    window_number = 0
-
-    for patient in instance['patients'].values():
-        for protocol in patient['protocols'].values():
-
-            initial_shift = protocol['initial_shift']
-            
-            for protocol_service in protocol['protocol_services']:
-
-                service_name = protocol_service['service']
-                service_duration = instance['services'][service_name]['duration']
-
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
-
-                for central_day_index in range(start, start + frequency * times, frequency):
-
-                    is_window_inside = False
+    first_positions, last_positions = get_windows_day_positions(windows_table)
+    is_window_inside = first_positions < last_positions
 
-                    for day_index in range(central_day_index - tolerance, central_day_index + tolerance + 1):
+    # every window adds its service duration to all its days
+    durations = windows_table['duration'][is_window_inside]
+    worst_case_request_scenario = np.zeros(len(windows_table['day_indexes']) + 1, dtype=int)
+    np.add.at(worst_case_request_scenario, first_positions[is_window_inside], durations)
+    np.add.at(worst_case_request_scenario, last_positions[is_window_inside], -durations)
+    worst_case_request_scenario = np.cumsum(worst_case_request_scenario)[:-1]
 
-                        day_name = str(day_index)
+    tolerance_sum = int(windows_table['tolerance'][is_window_inside].sum())
+    window_number = int(np.count_nonzero(is_window_inside))
 
-                        if day_name in instance['days']:
-                            worst_case_request_scenario[day_name] += service_duration
-                            is_window_inside = True
-
-                    if is_window_inside:
-                        window_number += 1
-                        tolerance_sum += tolerance
+    day_positions = {day_index: position for position, day_index in enumerate(windows_table['day_indexes'].tolist())}
 
     disponibility_vs_requests = 0
     for day_name in instance['days'].keys():
-        if worst_case_request_scenario[day_name] > 0:
-            disponibility_vs_requests += days_disponibility[day_name] / worst_case_request_scenario[day_name]
+        worst_case_requests = int(worst_case_request_scenario[day_positions[int(day_name)]])
+        if worst_case_requests > 0:
+            disponibility_vs_requests += days_disponibility[day_name] / worst_case_requests
 
     average_window_size = (tolerance_sum / window_number) * 2 + 1
 
@@ -114,98 +163,223 @@ def get_average_time_slots_per_care_unit(instance):
     return time_slots_global_sum / care_unit_number
 
 
-def get_average_overlapping_requests_per_patient(instance):
+def get_clamped_windows(windows_table):
 
-    day_number = len(instance['days'].keys())
-    min_day = min([int(day_name) for day_name in instance['days'].keys()])
+    # windows are clamped to the day range, discarding the ones fully outside
+    day_indexes = windows_table['day_indexes']
+    min_day = int(day_indexes[0])
+    max_day = min_day + len(day_indexes) - 1
 
-    overlap_window_day_number = 0
+    starts = np.maximum(windows_table['start'], min_day)
+    ends = np.minimum(windows_table['end'], max_day)
+    is_window_inside = ends >= starts
 
-    for patient in instance['patients'].values():
+    return windows_table['patient'][is_window_inside], starts[is_window_inside] - min_day, ends[is_window_inside] - min_day
 
-        windows = []
 
-        for protocol in patient['protocols'].values():
-            
-            initial_shift = protocol['initial_shift']
-            
-            for protocol_service in protocol['protocol_services']:
+def get_average_overlapping_requests_per_patient(instance, windows_table=None):
 
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
 
-                for central_day_index in range(start, start + frequency * times, frequency):
+    patients, starts, ends = get_clamped_windows(windows_table)
 
-                    window = {
-                        'start': central_day_index - tolerance,
-                        'end': central_day_index + tolerance
-                    }
+    # the overlap of two windows is 'min(ends) - max(starts)', that is the
+    # number of the day intervals [day; day + 1) covered by both; summing over
+    # all window couples gives 'k * (k - 1) / 2' for each interval covered by
+    # 'k' windows of the same patient
+    coverings = np.zeros((len(windows_table['patient_names']), len(windows_table['day_indexes']) + 1), dtype=int)
+    np.add.at(coverings, (patients, starts), 1)
+    np.add.at(coverings, (patients, ends), -1)
+    coverings = np.cumsum(coverings, axis=1)
 
-                    if window['start'] < min_day:
-                        window['start'] = min_day
-                    if window['end'] > min_day + day_number - 1:
-                        window['end'] = min_day + day_number - 1
-                    
-                    if window['end'] >= window['start']:
-                        windows.append(window)
-        
-        for index in range(len(windows) - 1):
-            for other_index in range(index + 1, len(windows)):
+    overlap_window_day_number = int((coverings * (coverings - 1) // 2).sum())
 
-                if (windows[index]['start'] <= windows[other_index]['start'] and windows[index]['end'] >= windows[other_index]['start']):
-                    min_end = min(windows[index]['end'], windows[other_index]['end'])
-                    overlap_window_day_number += min_end - windows[other_index]['start']
-                    continue
+    return overlap_window_day_number / len(instance['patients'].keys())
 
-                if (windows[other_index]['start'] <= windows[index]['start'] and windows[other_index]['end'] >= windows[index]['start']):
-                    min_end = min(windows[index]['end'], windows[other_index]['end'])
-                    overlap_window_day_number += min_end - windows[index]['start']
 
-    return overlap_window_day_number / len(instance['patients'].keys())
+def get_max_requests_in_same_day_per_patient(instance, windows_table=None):
 
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
 
-def get_max_requests_in_same_day_per_patient(instance):
+    patients, starts, ends = get_clamped_windows(windows_table)
 
-    day_number = len(instance['days'].keys())
-    min_day = min([int(day_name) for day_name in instance['days'].keys()])
+    # number of windows of each patient (rows) that contain each day (columns)
+    overlappings = np.zeros((len(windows_table['patient_names']), len(windows_table['day_indexes']) + 1), dtype=int)
+    np.add.at(overlappings, (patients, starts), 1)
+    np.add.at(overlappings, (patients, ends + 1), -1)
+    overlappings = np.cumsum(overlappings, axis=1)[:, :-1]
 
-    global_max_overlap_windows = 0
+    if overlappings.size == 0:
+        return 0
+    
+    return int(overlappings.max())
 
-    for patient_name, patient in instance['patients'].items():
 
-        overlappings = [0 for _ in range(day_number)]
+def get_windows_day_cells(windows_table):
 
-        for protocol in patient['protocols'].values():
-            
-            initial_shift = protocol['initial_shift']
-            
-            for protocol_service in protocol['protocol_services']:
+    # every (window, day) couple with the day inside the instance, as the
+    # window index and the day position in 'day_indexes'
+    first_positions, last_positions = get_windows_day_positions(windows_table)
+    lengths = last_positions - first_positions
 
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
+    window_indexes = np.repeat(np.arange(len(lengths)), lengths)
+    day_positions = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(first_positions, lengths)
 
-                for central_day_index in range(start, start + frequency * times, frequency):
-                    for day_index in range(central_day_index - tolerance, central_day_index + tolerance + 1):
+    return window_indexes, day_positions
+
+
+def get_requests_per_day_care_unit(instance, windows_table=None):
+
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
+
+    window_indexes, day_positions = get_windows_day_cells(windows_table)
+
+    # services of care units not offered in any day are not counted
+    care_units = windows_table['care_unit'][window_indexes]
+    is_care_unit_offered = care_units >= 0
+    window_indexes = window_indexes[is_care_unit_offered]
+    day_positions = day_positions[is_care_unit_offered]
+    care_units = care_units[is_care_unit_offered]
+
+    durations = windows_table['duration'][window_indexes]
+    tolerances = windows_table['tolerance'][window_indexes]
+
+    # matrices with care units as rows and days as columns: the spread one
+    # divides each request between all the days of its window
+    shape = (len(windows_table['care_unit_names']), len(windows_table['day_indexes']))
+    requests_per_day_care_unit = np.zeros(shape, dtype=int)
+    spread_requests_per_day_care_unit = np.zeros(shape, dtype=float)
+    np.add.at(requests_per_day_care_unit, (care_units, day_positions), durations)
+    np.add.at(spread_requests_per_day_care_unit, (care_units, day_positions), durations / (2 * tolerances + 1))
+
+    return requests_per_day_care_unit, spread_requests_per_day_care_unit
+
+
+def get_requests_per_day_patient(instance, windows_table=None):
+
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
+
+    window_indexes, day_positions = get_windows_day_cells(windows_table)
+
+    patients = windows_table['patient'][window_indexes]
+    tolerances = windows_table['tolerance'][window_indexes]
+
+    # matrices with patients as rows and days as columns
+    shape = (len(windows_table['patient_names']), len(windows_table['day_indexes']))
+    requests_per_day_patient = np.zeros(shape, dtype=int)
+    spread_requests_per_day_patient = np.zeros(shape, dtype=float)
+    np.add.at(requests_per_day_patient, (patients, day_positions), 1)
+    np.add.at(spread_requests_per_day_patient, (patients, day_positions), 1 / (2 * tolerances + 1))
+
+    return requests_per_day_patient, spread_requests_per_day_patient
+
+
+def get_capacity_per_day_care_unit(instance, windows_table=None):
+
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
+
+    # matrix with care units as rows and days as columns
+    return np.array([[
+        sum(operator['duration'] for operator in instance['days'][str(day_index)].get(care_unit_name, {}).values())
+        for day_index in windows_table['day_indexes'].tolist()]
+        for care_unit_name in windows_table['care_unit_names']], dtype=int).reshape(len(windows_table['care_unit_names']), len(windows_table['day_indexes']))
 
-                        if day_index < min_day or day_index >= day_number + min_day:
-                            continue
-                        
-                        overlappings[day_index - min_day] += 1
 
-        max_overlap_windows = max(overlappings)
-        if max_overlap_windows > global_max_overlap_windows:
-            global_max_overlap_windows = max_overlap_windows
+def get_metrics_cache(cache_path):
+
+    # the cache maps each file path, relative to the input folder, to its
+    # signature and to its computed CSV row
+    if not cache_path.exists():
+        return {}
     
-    return global_max_overlap_windows
+    # every JSON library raises a ValueError on a broken file
+    try:
+        return read_json(cache_path)
+    except ValueError:
+        return {}
+
+
+def save_metrics_cache(cache_path, cache):
+
+    # the cache is written to a temporary file first, so an interrupted run
+    # never leaves a broken one
+    temporary_cache_path = cache_path.with_name(f'{cache_path.name}.tmp')
+    write_json(temporary_cache_path, cache, compact=True)
+    temporary_cache_path.replace(cache_path)
+
+
+def get_file_signature(file_path):
+
+    # a file is considered changed if its size or modification time changed
+    file_stat = file_path.stat()
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+
+def get_cached_rows(input_folder_path, file_paths, cache_name, get_row):
+
+    cache_path = input_folder_path.joinpath(cache_name)
+    cache = get_metrics_cache(cache_path)
+    is_cache_changed = False
+
+    rows = []
+    for file_path in file_paths:
+
+        key = str(file_path.relative_to(input_folder_path))
+        signature = get_file_signature(file_path)
+
+        # only new or changed files are analyzed again
+        if key not in cache or cache[key]['signature'] != signature:
+            cache[key] = {'signature': signature, 'row': get_row(file_path)}
+            is_cache_changed = True
+        
+        rows.append(dict(cache[key]['row']))
+    
+    # forget the files that do not exist anymore
+    for key in list(cache.keys()):
+        if not input_folder_path.joinpath(key).exists():
+            del cache[key]
+            is_cache_changed = True
+    
+    if is_cache_changed:
+        save_metrics_cache(cache_path, cache)
+
+    return rows
+
+
+def get_instance_row(instance_path):
+
+    instance = get_expanded_instance(read_json(instance_path))
+    
+    # all metrics share the same unrolled windows
+    windows_table = get_windows_table(instance)
+
+    # compute request number
+    window_number = get_total_window_number(instance, windows_table)
+    normalized_disponibility_vs_requests, average_window_size = get_normalized_disponibility_vs_requests(instance, windows_table)
+
+    # add results to the result object
+    results_info = {}
+    results_info['group'] = instance_path.parent.name
+    results_info['instance'] = instance_path.name
+    results_info['window_number'] = window_number
+    results_info['average_windows_per_patient'] = round(window_number / len(instance['patients'].keys()), 4)
+    results_info['normalized_disponibility_vs_requests'] = round(normalized_disponibility_vs_requests, 4)
+    results_info['average_window_size'] = round(average_window_size, 4)
+    results_info['average_time_slots_per_care_unit'] = round(get_average_time_slots_per_care_unit(instance), 4)
+    results_info['average_overlapping_requests_per_patient'] = round(get_average_overlapping_requests_per_patient(instance, windows_table), 4)
+    results_info['max_requests_in_same_day_per_patient'] = round(get_max_requests_in_same_day_per_patient(instance, windows_table), 4)
+
+    return results_info
 
 
 def generate_csv_instances_file(input_folder_path, group_prefix=None):
     
-    results_data = []
+    instance_paths = []
 
     # iterate every directory
     for group_path in input_folder_path.iterdir():
@@ -227,26 +401,10 @@ def generate_csv_instances_file(input_folder_path, group_prefix=None):
             if instance_path.name.startswith('SOL_'):
                 continue
 
-            with open(instance_path, 'r') as file:
-                instance = json.load(file)
-            
-            # compute request number
-            window_number = get_total_window_number(instance)
-            normalized_disponibility_vs_requests, average_window_size = get_normalized_disponibility_vs_requests(instance)
-
-            # add results to the result object
-            results_info = {}
-            results_info['group'] = instance_path.parent.name
-            results_info['instance'] = instance_path.name
-            results_info['window_number'] = window_number
-            results_info['average_windows_per_patient'] = round(window_number / len(instance['patients'].keys()), 4)
-            results_info['normalized_disponibility_vs_requests'] = round(normalized_disponibility_vs_requests, 4)
-            results_info['average_window_size'] = round(average_window_size, 4)
-            results_info['average_time_slots_per_care_unit'] = round(get_average_time_slots_per_care_unit(instance), 4)
-            results_info['average_overlapping_requests_per_patient'] = round(get_average_overlapping_requests_per_patient(instance), 4)
-            results_info['max_requests_in_same_day_per_patient'] = round(get_max_requests_in_same_day_per_patient(instance), 4)
-
-            results_data.append(results_info)
+            instance_paths.append(instance_path)
+
+    # rows of unchanged instances are taken from the cache
+    results_data = get_cached_rows(input_folder_path, instance_paths, 'instances_cache.json', get_instance_row)
 
     field_names = [
         'group',
@@ -267,9 +425,29 @@ def generate_csv_instances_file(input_folder_path, group_prefix=None):
         writer.writerows(results_data)
 
 
-def generate_csv_results_file(input_folder_path, group_prefix=None):
+def get_results_row(results_path):
+
+    results = read_json(results_path)
     
-    results_data = []
+    # compute request numbers
+    rejected_window_number = len(results['rejected'])
+    window_number = rejected_window_number
+    for day in results['scheduled'].values():
+        window_number += len(day)
+
+    # add those results to the result object
+    results_info = results['info']
+    results_info['group'] = results_path.parent.name
+    results_info['instance'] = results_path.name
+    results_info['window_number'] = window_number
+    results_info['rejected_window_number'] = rejected_window_number
+
+    return results_info
+
+
+def get_results_rows(input_folder_path, group_prefix=None):
+
+    results_paths = []
 
     # iterate every directory
     for group_path in input_folder_path.iterdir():
@@ -291,23 +469,15 @@ def generate_csv_results_file(input_folder_path, group_prefix=None):
             if not results_path.name.startswith('SOL_'):
                 continue
 
-            with open(results_path, 'r') as file:
-                results = json.load(file)
-            
-            # compute request numbers
-            rejected_window_number = len(results['rejected'])
-            window_number = rejected_window_number
-            for day in results['scheduled'].values():
-                window_number += len(day)
+            results_paths.append(results_path)
 
-            # add those results to the result object
-            results_info = results['info']
-            results_info['group'] = results_path.parent.name
-            results_info['instance'] = results_path.name
-            results_info['window_number'] = window_number
-            results_info['rejected_window_number'] = rejected_window_number
+    # rows of unchanged results are taken from the cache
+    return get_cached_rows(input_folder_path, results_paths, 'results_cache.json', get_results_row)
 
-            results_data.append(results_info)
+
+def generate_csv_results_file(input_folder_path, group_prefix=None):
+    
+    results_data = get_results_rows(input_folder_path, group_prefix)
 
     field_names = [
         'group',
@@ -339,7 +509,8 @@ def plot_averages(group_names, averages, save_path):
     width = 0.25
     multiplier = 0
 
-    fig, ax = plt.subplots()
+    fig = Figure()
+    ax = fig.subplots()
 
     for attribute, measurement in averages.items():
 
@@ -355,8 +526,7 @@ def plot_averages(group_names, averages, save_path):
     ax.set_xticks(x + width, group_names, fontsize=5)
     ax.legend(loc='upper right')
 
-    plt.savefig(save_path)
-    plt.close('all')
+    fig.savefig(save_path)
 
 
 def generate_averages_plot(input_folder_path, group_prefix=None):
@@ -369,59 +539,34 @@ def generate_averages_plot(input_folder_path, group_prefix=None):
         'solver_internal_time': []
     }
 
-    # iterate every directory
-    for group_path in input_folder_path.iterdir():
-        
-        if not group_path.is_dir():
-            continue
-
-        if group_prefix is not None and not group_path.name.startswith(group_prefix):
-            continue
-
-        model_creation_time_sum = 0.0
-        model_solving_time_sum = 0.0
-        solver_internal_time_sum = 0.0
-
-        instance_number = 0
-
-        # iterate every instance
-        for results_path in group_path.iterdir():
-
-            # only valid JSON files that starts with 'SOL_'
-            if results_path.suffix != '.json':
-                continue
-            if results_path.name == 'info.json':
-                continue
-            if not results_path.name.startswith('SOL_'):
-                continue
-
-            with open(results_path, 'r') as file:
-                results = json.load(file)
-
-            # keep track of the time sums for this group
-            results_info = results['info']
-            model_creation_time_sum += results_info['model_creation_time']
-            model_solving_time_sum += results_info['model_solving_time']
-            solver_internal_time_sum += results_info['solver_internal_time']
-
-            # the istance number is used in the average computation
-            instance_number += 1
+    # results are grouped in the same order they are found
+    group_rows = {}
+    for results_info in get_results_rows(input_folder_path, group_prefix):
+        if results_info['group'] not in group_rows:
+            group_rows[results_info['group']] = []
+        group_rows[results_info['group']].append(results_info)
+
+    for group_name, rows in group_rows.items():
+
+        # keep track of the time sums for this group
+        model_creation_time_sum = sum(results_info['model_creation_time'] for results_info in rows)
+        model_solving_time_sum = sum(results_info['model_solving_time'] for results_info in rows)
+        solver_internal_time_sum = sum(results_info['solver_internal_time'] for results_info in rows)
+
+        # the istance number is used in the average computation
+        instance_number = len(rows)
+
+        # add the group name in a list
+        group_name = group_name.removeprefix('equal_resources_')
+        group_name = group_name.removeprefix('operator_overlap_')
+        group_name = group_name.removeprefix('requests_')
+        group_name = group_name.removeprefix('var_patients_')
+        group_names.append(group_name)
         
-        # if there is at least one valid instance in this group
-        if instance_number > 0:
-
-            # add the group name in a list
-            group_name = group_path.name
-            group_name = group_name.removeprefix('equal_resources_')
-            group_name = group_name.removeprefix('operator_overlap_')
-            group_name = group_name.removeprefix('requests_')
-            group_name = group_name.removeprefix('var_patients_')
-            group_names.append(group_name)
-            
-            # add averages in their respective lists
-            averages['model_creation_time'].append(model_creation_time_sum / instance_number)
-            averages['model_solving_time'].append(model_solving_time_sum / instance_number)
-            averages['solver_internal_time'].append(solver_internal_time_sum / instance_number)
+        # add averages in their respective lists
+        averages['model_creation_time'].append(model_creation_time_sum / instance_number)
+        averages['model_solving_time'].append(model_solving_time_sum / instance_number)
+        averages['solver_internal_time'].append(solver_internal_time_sum / instance_number)
 
     # plot the averages for each group
     plot_averages(group_names, averages, input_folder_path.joinpath('time_averages.png'))
@@ -429,7 +574,8 @@ def generate_averages_plot(input_folder_path, group_prefix=None):
 
 def plot_master_instance(instance, results, save_path):
 
-    fig, (ax1, ax2) = plt.subplots(2, 1)
+    fig = Figure()
+    ax1, ax2 = fig.subplots(2, 1)
     fig.set_size_inches(16, 8)
 
     slot_width = 2.0
@@ -447,8 +593,6 @@ def plot_master_instance(instance, results, save_path):
     care_unit_names = set()
 
     # draw upper graphic (total care unit requests per each day)
-    plt.sca(ax1)
-
     for day_name, day in instance['days'].items():
 
         care_unit_x_positions[day_name] = {}
@@ -467,7 +611,7 @@ def plot_master_instance(instance, results, save_path):
                 max_total_care_unit_duration = total_care_unit_duration
 
             # each care unit has an horizontal bold line indicating its own total duration
-            plt.hlines(xmin=care_unit_x_position, xmax=care_unit_x_position + slot_width, y=total_care_unit_duration, colors='black', lw=2, zorder=0)
+            ax1.hlines(xmin=care_unit_x_position, xmax=care_unit_x_position + slot_width, y=total_care_unit_duration, colors='black', lw=2, zorder=0)
             
             care_unit_x_position += slot_width
 
@@ -488,9 +632,9 @@ def plot_master_instance(instance, results, save_path):
             if care_unit_x_position < min_care_unit_x_position:
                 min_care_unit_x_position = care_unit_x_position
 
-        plt.vlines(x=(min_care_unit_x_position - space_between_days * 0.5), ymin = 0, ymax=max_total_care_unit_duration, colors='grey', lw=0.5, ls=':', zorder=0)
+        ax1.vlines(x=(min_care_unit_x_position - space_between_days * 0.5), ymin = 0, ymax=max_total_care_unit_duration, colors='grey', lw=0.5, ls=':', zorder=0)
     # last day right vertical line
-    plt.vlines(x=(last_care_unit_x_position + space_between_days * 0.5), ymin = 0, ymax=max_total_care_unit_duration, colors='grey', lw=0.5, ls=':', zorder=0)
+    ax1.vlines(x=(last_care_unit_x_position + space_between_days * 0.5), ymin = 0, ymax=max_total_care_unit_duration, colors='grey', lw=0.5, ls=':', zorder=0)
 
     # assign a color to each care unit encountered
     care_unit_colors = {}
@@ -531,8 +675,6 @@ def plot_master_instance(instance, results, save_path):
     ax1.set_ylabel('Total request slots', weight='bold', labelpad=8)
 
     # draw lower graphic (patient protocol requests)
-    plt.sca(ax2)
-
     # vertical position of the boxes
     request_y_position = 0
 
@@ -584,16 +726,16 @@ def plot_master_instance(instance, results, save_path):
                     start = day_x_positions[str(start)] - start_day_len * slot_width * 0.5
                     end = day_x_positions[str(end)] - end_day_len * slot_width * 0.5
 
-                    plt.hlines(
+                    ax2.hlines(
                         xmin=start, xmax=end,
                         y=request_y_position + space_between_rows + (slot_height - space_between_rows) * 0.5,
                         lw=2, colors=care_unit_colors[care_unit_name], zorder=2)
-                    plt.vlines(
+                    ax2.vlines(
                         x=start,
                         ymin=request_y_position + space_between_rows + space_between_rows,
                         ymax=request_y_position + space_between_rows + (slot_height - space_between_rows * 2),
                         lw=1.5, colors=care_unit_colors[care_unit_name], zorder=2)
-                    plt.vlines(
+                    ax2.vlines(
                         x=end,
                         ymin=request_y_position + space_between_rows + space_between_rows,
                         ymax=request_y_position + space_between_rows + (slot_height - space_between_rows * 2),
@@ -609,13 +751,13 @@ def plot_master_instance(instance, results, save_path):
             care_unit_name = instance['services'][service_name]['care_unit']
             day_len = len(instance['days'][day_name])
             pos = day_x_positions[day_name]
-            plt.plot(pos, request_y_positions[(patient_name, service_name)] + space_between_rows * 0.5, 'x', color='k')
+            ax2.plot(pos, request_y_positions[(patient_name, service_name)] + space_between_rows * 0.5, 'x', color='k')
 
     # draw thin vertical lines between each day
     for day_name, day in instance['days'].items():
-        plt.vlines(x=(day_x_positions[day_name] - len(day) * slot_width * 0.5), ymin = 0, ymax=request_y_position, colors='grey', lw=0.5, ls=':', zorder=0)
+        ax2.vlines(x=(day_x_positions[day_name] - len(day) * slot_width * 0.5), ymin = 0, ymax=request_y_position, colors='grey', lw=0.5, ls=':', zorder=0)
     # last day right vertical line
-    plt.vlines(x=(last_care_unit_x_position + space_between_days * 0.5), ymin = 0, ymax=request_y_position, colors='grey', lw=0.5, ls=':', zorder=0)
+    ax2.vlines(x=(last_care_unit_x_position + space_between_days * 0.5), ymin = 0, ymax=request_y_position, colors='grey', lw=0.5, ls=':', zorder=0)
 
     # add axis ticks
     ax2.set_xticks(list(day_x_positions.values())[:-1], labels=list(care_unit_x_positions.keys()))
@@ -629,11 +771,58 @@ def plot_master_instance(instance, results, save_path):
 
     fig.suptitle(f'Solution of instance {save_path.name.removesuffix(".png")}', weight='bold')
 
-    plt.savefig(save_path, dpi=500)
-    plt.close('all')
+    fig.savefig(save_path, dpi=500)
+
+
+def is_plot_up_to_date(plot_path, input_paths):
+
+    # a plot is redone only if one of its inputs changed after it
+    if not plot_path.exists():
+        return False
+    
+    plot_time = plot_path.stat().st_mtime
+    return all(input_path.stat().st_mtime < plot_time for input_path in input_paths)
+
 
+def plot_instance_files(instance_path):
 
-def plot_all_instances(input_folder_path, group_prefix=None):
+    plots_path = instance_path.parent.joinpath('plots')
+    care_unit_fullness_path = plots_path.joinpath(f'fullness_cu_{instance_path.name.removesuffix(".json")}.png')
+    patients_fullness_path = plots_path.joinpath(f'fullness_pat_{instance_path.name.removesuffix(".json")}.png')
+    master_path = plots_path.joinpath(instance_path.name.removesuffix('.json') + '.png')
+    results_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}')
+
+    do_plot_care_unit_fullness = not is_plot_up_to_date(care_unit_fullness_path, [instance_path])
+    do_plot_patients_fullness = not is_plot_up_to_date(patients_fullness_path, [instance_path])
+    do_plot_master = results_path.exists() and not is_plot_up_to_date(master_path, [instance_path, results_path])
+
+    # the instance is not even read if all its plots are up to date
+    if not do_plot_care_unit_fullness and not do_plot_patients_fullness and not do_plot_master:
+        return
+
+    instance = get_expanded_instance(read_json(instance_path))
+    
+    plots_path.mkdir(exist_ok=True)
+
+    if do_plot_care_unit_fullness or do_plot_patients_fullness:
+
+        # both fullness plots share the same unrolled windows
+        windows_table = get_windows_table(instance)
+
+        if do_plot_care_unit_fullness:
+            plot_instance_care_unit_fullness(instance, care_unit_fullness_path, windows_table)
+        if do_plot_patients_fullness:
+            plot_instance_patients_fullness(instance, patients_fullness_path, windows_table)
+    
+    if do_plot_master:
+        results = read_json(results_path)
+        
+        plot_master_instance(instance, results, master_path)
+
+
+def plot_all_instances(input_folder_path, group_prefix=None, jobs=1):
+
+    instance_paths = []
 
     # iterate every directory
     for group_path in input_folder_path.iterdir():
@@ -655,72 +844,32 @@ def plot_all_instances(input_folder_path, group_prefix=None):
             if instance_path.name.startswith('SOL_'):
                 continue
 
-            with open(instance_path, 'r') as file:
-                instance = json.load(file)
-            
-            group_path.joinpath('plots').mkdir(exist_ok=True)
-            plot_instance_care_unit_fullness(instance, instance_path.parent.joinpath('plots').joinpath(Path(f'fullness_cu_{instance_path.name.removesuffix(".json")}.png')))
-            plot_instance_patients_fullness(instance, instance_path.parent.joinpath('plots').joinpath(Path(f'fullness_pat_{instance_path.name.removesuffix(".json")}.png')))
-            
-            results_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}')
-            if results_path.exists():
-                with open(results_path) as file:
-                    results = json.load(file)
-                
-                plot_master_instance(instance, results, instance_path.parent.joinpath('plots').joinpath(instance_path.name.removesuffix('.json') + '.png'))
+            instance_paths.append(instance_path)
 
+    # each instance is plotted independently from the others
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(plot_instance_files, instance_paths))
+    else:
+        for instance_path in instance_paths:
+            plot_instance_files(instance_path)
 
-def plot_instance_care_unit_fullness(instance, save_path):
 
-    day_names = sorted(instance['days'].keys(), key=lambda v: int(v))
-    
-    care_unit_names = set()
-    for day in instance['days'].values():
-        care_unit_names.update(day.keys())
-    care_unit_names = sorted(care_unit_names)
-    
-    day_care_unit_capacity = []
-    for care_unit_name in care_unit_names:
-        row = []
-        for day_name in day_names:
-            row.append(sum(operator['duration'] for operator in instance['days'][day_name][care_unit_name].values()))
-        day_care_unit_capacity.append(row)
-
-    requests_per_day_care_unit = []
-    spread_requests_per_day_care_unit = []
-    for _ in range(len(care_unit_names)):
-        requests_per_day_care_unit.append([0 for _ in range(len(day_names))])
-        spread_requests_per_day_care_unit.append([0 for _ in range(len(day_names))])
-
-    for patient in instance['patients'].values():
-        for protocol in patient['protocols'].values():
+def plot_instance_care_unit_fullness(instance, save_path, windows_table=None):
 
-            initial_shift = protocol['initial_shift']
-            
-            for protocol_service in protocol['protocol_services']:
-
-                service_name = protocol_service['service']
-                care_unit_name = instance['services'][service_name]['care_unit']
-                service_duration = instance['services'][service_name]['duration']
-
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
-
-                for central_day_index in range(start, start + frequency * times, frequency):
-                    for day_index in range(central_day_index - tolerance, central_day_index + tolerance + 1):
-                        day_name = str(day_index)
-                        if day_name not in day_names or care_unit_name not in care_unit_names:
-                            continue
-
-                        coordinate = (day_names.index(day_name), care_unit_names.index(care_unit_name))
-                        requests_per_day_care_unit[coordinate[1]][coordinate[0]] += service_duration
-                        spread_requests_per_day_care_unit[coordinate[1]][coordinate[0]] += service_duration / (2 * tolerance + 1)
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
 
-    fig, (ax1, ax2) = plt.subplots(2, 1)
+    day_names = [str(day_index) for day_index in windows_table['day_indexes'].tolist()]
+    care_unit_names = windows_table['care_unit_names']
     
-    plt.sca(ax1)
+    day_care_unit_capacity = get_capacity_per_day_care_unit(instance, windows_table).tolist()
+    requests_per_day_care_unit, spread_requests_per_day_care_unit = get_requests_per_day_care_unit(instance, windows_table)
+    requests_per_day_care_unit = requests_per_day_care_unit.tolist()
+    spread_requests_per_day_care_unit = spread_requests_per_day_care_unit.tolist()
+
+    fig = Figure()
+    ax1, ax2 = fig.subplots(2, 1)
 
     ax1.imshow(requests_per_day_care_unit)
 
@@ -731,8 +880,6 @@ def plot_instance_care_unit_fullness(instance, save_path):
         for i in range(len(care_unit_names)):
             ax1.text(j, i, round(requests_per_day_care_unit[i][j] / day_care_unit_capacity[i][j], 3), ha="center", va="center", color="w", fontsize=3)
 
-    plt.sca(ax2)
-
     ax2.imshow(spread_requests_per_day_care_unit)
 
     ax2.set_xticks(range(len(day_names)), labels=day_names, rotation=45, ha="right", rotation_mode="anchor")
@@ -747,48 +894,23 @@ def plot_instance_care_unit_fullness(instance, save_path):
     fig.suptitle(f'Instance {save_path.name.removesuffix(".png")}', weight='bold')
     fig.tight_layout()
 
-    plt.savefig(save_path, dpi=500)
-    plt.close('all')
-
-
-def plot_instance_patients_fullness(instance, save_path):
-
-    day_names = sorted(instance['days'].keys(), key=lambda v: int(v))
-    
-    patient_names = sorted(instance['patients'].keys())
+    fig.savefig(save_path, dpi=500)
 
-    requests_per_day_patient = []
-    spread_requests_per_day_patient = []
-    for _ in range(len(patient_names)):
-        requests_per_day_patient.append([0 for _ in range(len(day_names))])
-        spread_requests_per_day_patient.append([0 for _ in range(len(day_names))])
 
-    for patient_name, patient in instance['patients'].items():
-        for protocol in patient['protocols'].values():
+def plot_instance_patients_fullness(instance, save_path, windows_table=None):
 
-            initial_shift = protocol['initial_shift']
-            
-            for protocol_service in protocol['protocol_services']:
+    if windows_table is None:
+        windows_table = get_windows_table(instance)
 
-                start = protocol_service['start'] + initial_shift
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-                times = protocol_service['times']
+    day_names = [str(day_index) for day_index in windows_table['day_indexes'].tolist()]
+    patient_names = windows_table['patient_names']
 
-                for central_day_index in range(start, start + frequency * times, frequency):
-                    for day_index in range(central_day_index - tolerance, central_day_index + tolerance + 1):
-                        
-                        day_name = str(day_index)
-                        if day_name not in day_names:
-                            continue
+    requests_per_day_patient, spread_requests_per_day_patient = get_requests_per_day_patient(instance, windows_table)
+    requests_per_day_patient = requests_per_day_patient.tolist()
+    spread_requests_per_day_patient = spread_requests_per_day_patient.tolist()
 
-                        coordinate = (day_names.index(day_name), patient_names.index(patient_name))
-                        requests_per_day_patient[coordinate[1]][coordinate[0]] += 1
-                        spread_requests_per_day_patient[coordinate[1]][coordinate[0]] += 1 / (2 * tolerance + 1)
-
-    fig, (ax1, ax2) = plt.subplots(2, 1)
-    
-    plt.sca(ax1)
+    fig = Figure()
+    ax1, ax2 = fig.subplots(2, 1)
 
     ax1.imshow(requests_per_day_patient)
 
@@ -799,8 +921,6 @@ def plot_instance_patients_fullness(instance, save_path):
         for i in range(len(patient_names)):
             ax1.text(j, i, requests_per_day_patient[i][j], ha="center", va="center", color="w", fontsize=3)
 
-    plt.sca(ax2)
-
     ax2.imshow(spread_requests_per_day_patient)
 
     ax2.set_xticks(range(len(day_names)), labels=day_names, rotation=45, ha="right", rotation_mode="anchor", fontsize=3)
@@ -811,5 +931,4 @@ def plot_instance_patients_fullness(instance, save_path):
     fig.suptitle(f'Instance {save_path.name.removesuffix(".png")}', weight='bold')
     fig.tight_layout()
 
-    plt.savefig(save_path, dpi=500)
-    plt.close('all')
\ No newline at end of file
+    fig.savefig(save_path, dpi=500)
@@ -1,84 +1,165 @@
 import argparse
 from pathlib import Path
+import sys
 import json
+import csv
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from json_tools import read_json
 
 from tools import check_master_validity, check_subproblem_validity
 
-parser = argparse.ArgumentParser(prog='Instance checker', description='This program is used to validate instance and results for correctness')
-parser.add_argument('-i', '--input', type=Path, help='Folder with instances and/or results', required=True)
-parser.add_argument('--ignore-results', action='store_true', help='If results are present, ignore them')
-parser.add_argument('-v', '--verbose', action='store_true')
-args = parser.parse_args()
 
-input_folder_path = Path(args.input).resolve()
-verbose = bool(args.verbose)
-ignore_results = bool(args.ignore_results)
+def check_instance(instance_path: Path, ignore_results: bool, collect_all: bool = False):
 
-# checks for file existance and validity
-if not input_folder_path.exists():
-    print('Input path not found')
-    exit(1)
+    start_time = perf_counter()
 
-if not input_folder_path.is_dir():
-    print('Input is not a directory')
+    # read instance file
+    instance = read_json(instance_path)
 
-for instance_path in input_folder_path.iterdir():
+    results_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}')
+    results = None
 
-    # the only valid files are JSON that don't start with 'SOL_'
-    if not instance_path.is_file() or instance_path.is_dir():
-        continue
+    # if it exists and is considered, read results file
+    if not ignore_results and results_path.exists():
+        results = read_json(results_path)
 
-    if instance_path.suffix != '.json':
-        continue
+    # if 'collect_all' is set, a list of records is returned, one for each
+    # violation found (or a single 'all ok' record)
+    if collect_all:
+        if 'days' in instance:
+            errors = check_master_validity(instance, results, collect_all=True)
+        else:
+            errors = check_subproblem_validity(instance, results, collect_all=True)
+        if len(errors) == 0:
+            errors = [('', 0, 'all ok')]
+        elapsed_time = perf_counter() - start_time
+        return [{
+            'instance': str(instance_path),
+            'results': str(results_path) if results is not None else None,
+            'path': path,
+            'error_code': error_code,
+            'error_message': error_message,
+            'time': elapsed_time
+        } for path, error_code, error_message in errors]
 
-    if str(instance_path.name).startswith('SOL_'):
-        continue
+    if 'days' in instance:
+        error_code, error_message = check_master_validity(instance, results)
+    else:
+        error_code, error_message = check_subproblem_validity(instance, results)
 
-    if instance_path.name == 'info.json':
-        continue
-    
-    # read instance file
-    with open(instance_path, 'r') as file:
-        instance = json.load(file)
+    return {
+        'instance': str(instance_path),
+        'results': str(results_path) if results is not None else None,
+        'error_code': error_code,
+        'error_message': error_message,
+        'time': perf_counter() - start_time
+    }
 
-    if verbose:
-        print(f'Read instance {instance_path}')
 
-    if ignore_results:
-        if 'days' in instance:
-            error_code, error_message = check_master_validity(instance)
-        else:
-            error_code, error_message = check_subproblem_validity(instance)
+if __name__ == '__main__':
 
-    # if it exists and is considered, read results file
+    parser = argparse.ArgumentParser(prog='Instance checker', description='This program is used to validate instance and results for correctness')
+    parser.add_argument('-i', '--input', type=Path, help='Folder with instances and/or results', required=True)
+    parser.add_argument('--ignore-results', action='store_true', help='If results are present, ignore them')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of files checked in parallel')
+    parser.add_argument('-s', '--summary', type=Path, help='Optional summary file of all checks (CSV if it ends with .csv, JSONL otherwise)')
+    parser.add_argument('-a', '--all-errors', action='store_true', help='Report every violation found instead of only the first one')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    input_folder_path = Path(args.input).resolve()
+    verbose = bool(args.verbose)
+    ignore_results = bool(args.ignore_results)
+    jobs = max(1, int(args.jobs))
+    summary_path = args.summary
+    collect_all = bool(args.all_errors)
+
+    # checks for file existance and validity
+    if not input_folder_path.exists():
+        print('Input path not found')
+        exit(1)
+
+    if not input_folder_path.is_dir():
+        print('Input is not a directory')
+
+    instance_paths = []
+    for instance_path in sorted(input_folder_path.iterdir()):
+
+        # the only valid files are JSON that don't start with 'SOL_'
+        if not instance_path.is_file() or instance_path.is_dir():
+            continue
+
+        if instance_path.suffix != '.json':
+            continue
+
+        if str(instance_path.name).startswith('SOL_'):
+            continue
+
+        if instance_path.name == 'info.json':
+            continue
+
+        instance_paths.append(instance_path)
+
+    # the check records are produced in the same order of 'instance_paths',
+    # whatever the number of jobs
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        records = executor.map(check_instance, instance_paths, repeat(ignore_results), repeat(collect_all), chunksize=16)
     else:
-        
-        results_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}')
-        if results_path.exists():
-            with open(results_path, 'r') as file:
-                results = json.load(file)
-            
-            if verbose:
-                print(f'Read results {results_path}')
-
-            if 'days' in instance:
-                error_code, error_message = check_master_validity(instance, results)
-            else:
-                error_code, error_message = check_subproblem_validity(instance, results)
-    
-        # if results are not found
-        else:
-            if verbose:
-                print(f'Results {results_path} not found')
-            
-            if 'days' in instance:
-                error_code, error_message = check_master_validity(instance)
+        executor = None
+        records = map(check_instance, instance_paths, repeat(ignore_results), repeat(collect_all))
+
+    # each file gives a list of records if all the errors are collected
+    if collect_all:
+        records = (record for file_records in records for record in file_records)
+
+    field_names = ['instance', 'results', 'error_code', 'error_message', 'time']
+    if collect_all:
+        field_names.insert(2, 'path')
+
+    summary_file = None
+    summary_writer = None
+    if summary_path is not None:
+        summary_file = open(summary_path, 'w', newline='')
+        if summary_path.suffix == '.csv':
+            summary_writer = csv.DictWriter(summary_file, fieldnames=field_names)
+            summary_writer.writeheader()
+
+    last_instance = None
+    for record in records:
+
+        # with all the errors collected, file reads are printed only once
+        if verbose and record['instance'] != last_instance:
+            print(f'Read instance {record["instance"]}')
+            if record['results'] is not None:
+                print(f'Read results {record["results"]}')
+            elif not ignore_results:
+                print(f'Results {Path(record["instance"]).parent.joinpath("SOL_" + Path(record["instance"]).name)} not found')
+
+        last_instance = record['instance']
+
+        # print the error message if is necessary
+        if verbose or record['error_code'] != 0:
+            if collect_all and record['path'] != '':
+                print(f'[{record["error_code"]}] Instance {record["instance"]} has error at "{record["path"]}": "{record["error_message"]}"')
             else:
-                error_code, error_message = check_subproblem_validity(instance)
-    
-    # print the error message if is necessary
-    if verbose or error_code != 0:
-        print(f'[{error_code}] Instance {instance_path} has error: "{error_message}"')
-
-if verbose:
-    print('All tests done')
\ No newline at end of file
+                print(f'[{record["error_code"]}] Instance {record["instance"]} has error: "{record["error_message"]}"')
+
+        # each record is written as soon as it's available
+        if summary_writer is not None:
+            summary_writer.writerow(record)
+        elif summary_file is not None:
+            summary_file.write(json.dumps(record) + '\n')
+
+    if summary_file is not None:
+        summary_file.close()
+    if executor is not None:
+        executor.shutdown()
+
+    if verbose:
+        print('All tests done')
@@ -1,230 +1,323 @@
-def check_services_validity(services, care_unit_names) -> tuple[int, str]:
+import bisect
+import heapq
+import math
+import sys
+from pathlib import Path
+
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from json_tools import get_expanded_instance
+
+
+# Every 'find_*_errors' function is a generator of (path, error_code, error_message)
+# records, one for each violation found. 'path' locates the wrong element inside
+# the checked object, with keys separated by '/'. The 'check_*' functions stop at
+# the first record (fail-first), that is computed lazily.
+
+
+def get_first_error(errors) -> tuple[int, str]:
+    for path, error_code, error_message in errors:
+        return (error_code, error_message)
+    return (0, 'all ok')
+
+
+def find_services_errors(services, care_unit_names):
     
     if type(services) is not dict:
-        return (2, '"services" is not an object')
+        yield ('', 2, '"services" is not an object')
+        return
     
     for service_name, service in services.items():
     
         # check for service object validity
         if type(service_name) is not str or len(service_name) <= 0:
-            return (3, f'service "{str(service_name)}" has an invalid name')
+            yield (str(service_name), 3, f'service "{str(service_name)}" has an invalid name')
         if type(service) is not dict:
-            return (3, f'service "{service_name}" is not an object')
+            yield (str(service_name), 3, f'service "{service_name}" is not an object')
+            continue
     
         if len(service) != 2:
-            return (4, f'service "{service_name}" has not the right attribute number')
+            yield (str(service_name), 4, f'service "{service_name}" has not the right attribute number')
     
         # care_unit checks
         if 'care_unit' not in service:
-            return (5, f'"care_unit" attribute not found in service "{service_name}"')
-        care_unit_name = service['care_unit']
-        if type(care_unit_name) is not str:
-            return (6, f'"care_unit" attribute name in service "{service_name}" is not a string')
-        if len(care_unit_name) <= 0:
-            return (7, f'"care_unit" attribute in service "{service_name}" is not valid')
-        if care_unit_name not in care_unit_names:
-            return (8, f'care unit "{service["care_unit"]} is not offered anywhere')
+            yield (str(service_name), 5, f'"care_unit" attribute not found in service "{service_name}"')
+        elif type(service['care_unit']) is not str:
+            yield (f'{service_name}/care_unit', 6, f'"care_unit" attribute name in service "{service_name}" is not a string')
+        elif len(service['care_unit']) <= 0:
+            yield (f'{service_name}/care_unit', 7, f'"care_unit" attribute in service "{service_name}" is not valid')
+        elif service['care_unit'] not in care_unit_names:
+            yield (f'{service_name}/care_unit', 8, f'care unit "{service["care_unit"]} is not offered anywhere')
     
         # duration checks
         if 'duration' not in service:
-            return (9, f'"duration" attribute not found in service "{service_name}"')
-        duration = service['duration']
-        if type(duration) is not int:
-            return (10, f'"duration" attribute in service "{service_name}" is not an integer')
-        if duration <= 0:
-            return (11, f'"duration" attribute in service "{service_name}" is not a positive value')
-    
-    return (0, 'all ok')
+            yield (str(service_name), 9, f'"duration" attribute not found in service "{service_name}"')
+        elif type(service['duration']) is not int:
+            yield (f'{service_name}/duration', 10, f'"duration" attribute in service "{service_name}" is not an integer')
+        elif service['duration'] <= 0:
+            yield (f'{service_name}/duration', 11, f'"duration" attribute in service "{service_name}" is not a positive value')
 
 
-def check_day_validity(day) -> tuple[int, str]:
+def check_services_validity(services, care_unit_names) -> tuple[int, str]:
+    return get_first_error(find_services_errors(services, care_unit_names))
+
+
+def find_day_errors(day):
 
     # check for day object validity
     if type(day) is not dict:
-        return (1, 'day is not an object')
+        yield ('', 1, 'day is not an object')
+        return
     
     for care_unit_name, care_unit in day.items():
         
         # check for care unit validity
         if type(care_unit_name) is not str:
-            return (2, f'care unit name "{str(care_unit_name)}" is not a string')
-        if len(care_unit_name) <= 0:
-            return (3, f'care unit "{care_unit_name}" has not a valid name')
+            yield (str(care_unit_name), 2, f'care unit name "{str(care_unit_name)}" is not a string')
+        elif len(care_unit_name) <= 0:
+            yield (care_unit_name, 3, f'care unit "{care_unit_name}" has not a valid name')
         if type(care_unit) is not dict:
-            return (4, f'care unit "{care_unit_name}" is not an object')
+            yield (str(care_unit_name), 4, f'care unit "{care_unit_name}" is not an object')
+            continue
         
         for operator_name, operator in care_unit.items():
 
+            path = f'{care_unit_name}/{operator_name}'
+
             # operator checks
             if type(operator_name) is not str:
-                return (5, f'operator name "{str(operator_name)}" in care unit "{care_unit_name}" is not a string')
-            if len(operator_name) <= 0:
-                return (6, f'operator name "{str(operator_name)}" in care unit "{care_unit_name}" has not a valid name')
+                yield (path, 5, f'operator name "{str(operator_name)}" in care unit "{care_unit_name}" is not a string')
+            elif len(operator_name) <= 0:
+                yield (path, 6, f'operator name "{str(operator_name)}" in care unit "{care_unit_name}" has not a valid name')
             if type(operator) is not dict:
-                return (7, f'operator "{str(operator_name)}" in care unit "{care_unit_name}" is not an object')
+                yield (path, 7, f'operator "{str(operator_name)}" in care unit "{care_unit_name}" is not an object')
+                continue
             if len(operator) != 2:
-                return (8, f'operator object "{str(operator_name)}" in care unit "{care_unit_name}" has not the right attribute number')
+                yield (path, 8, f'operator object "{str(operator_name)}" in care unit "{care_unit_name}" has not the right attribute number')
 
             # operator start checks
             if 'start' not in operator:
-                return (9, f'"start" attribute not found in operator "{operator_name}" of care unit "{care_unit_name}"')
-            start = operator['start']
-            if type(start) is not int:
-                return (10, f'"start" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not an integer')
-            if start < 0:
-                return (11, f'"start" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not a non-negative value')
+                yield (path, 9, f'"start" attribute not found in operator "{operator_name}" of care unit "{care_unit_name}"')
+            elif type(operator['start']) is not int:
+                yield (f'{path}/start', 10, f'"start" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not an integer')
+            elif operator['start'] < 0:
+                yield (f'{path}/start', 11, f'"start" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not a non-negative value')
             
             # operator duration checks
             if 'duration' not in operator:
-                return (12, f'"duration" attribute not found in operator "{operator_name}" of care unit "{care_unit_name}"')
-            duration = operator['duration']
-            if type(duration) is not int:
-                return (13, f'"duration" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not an integer')
-            if duration <= 0:
-                return (14, f'"duration" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not a positive value')
+                yield (path, 12, f'"duration" attribute not found in operator "{operator_name}" of care unit "{care_unit_name}"')
+            elif type(operator['duration']) is not int:
+                yield (f'{path}/duration', 13, f'"duration" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not an integer')
+            elif operator['duration'] <= 0:
+                yield (f'{path}/duration', 14, f'"duration" attribute in operator "{operator_name}" of care unit "{care_unit_name}" is not a positive value')
 
-    return (0, 'all ok')
 
+def check_day_validity(day) -> tuple[int, str]:
+    return get_first_error(find_day_errors(day))
 
-def check_days_validity(days) -> tuple[int, str]:
+
+def find_days_errors(days):
 
     if type(days) is not dict:
-        return (1, 'days is not an object')
+        yield ('', 1, 'days is not an object')
+        return
     
     for day_name, day in days.items():
     
         # check for day validity
         if type(day_name) is not str:
-            return (2, f'day name "{str(day_name)}" is not a string')
-        if len(day_name) <= 0:
-            return (3, f'day "{day_name}" has not a valid name')
+            yield (str(day_name), 2, f'day name "{str(day_name)}" is not a string')
+        elif len(day_name) <= 0:
+            yield (day_name, 3, f'day "{day_name}" has not a valid name')
         if type(day) is not dict:
-            return (4, f'day "{day_name}" is not an object')
+            yield (str(day_name), 4, f'day "{day_name}" is not an object')
+            continue
     
-        error_code, error_message = check_day_validity(day)
-        if error_code != 0:
-            return (error_code, error_message)
-    
-    return (0, 'all ok')
+        for path, error_code, error_message in find_day_errors(day):
+            yield (f'{day_name}/{path}', error_code, error_message)
 
 
-def check_patients_validity(patients, service_names, min_day, max_day) -> tuple[int, str]:
+def check_days_validity(days) -> tuple[int, str]:
+    return get_first_error(find_days_errors(days))
+
+
+def find_patients_errors(patients, service_names, min_day, max_day):
 
     if type(patients) is not dict:
-        return (1, f'patients is not an object')
+        yield ('', 1, f'patients is not an object')
+        return
 
     for patient_name, patient in patients.items():
 
         if type(patient_name) is not str:
-            return (2, f'patient name "{str(patient_name)}" is not a string')
-        if len(patient_name) <= 0:
-            return (3, f'patient "{patient_name}" has not a valid name')
+            yield (str(patient_name), 2, f'patient name "{str(patient_name)}" is not a string')
+        elif len(patient_name) <= 0:
+            yield (patient_name, 3, f'patient "{patient_name}" has not a valid name')
         if type(patient) is not dict:
-            return (4, f'patient {patient_name} is not an object')
+            yield (str(patient_name), 4, f'patient {patient_name} is not an object')
+            continue
         
         if 'priority' in patient:
             if type(patient['priority']) is not int or patient['priority'] <= 0:
-                return (5, f'patient {patient_name} has invalid priority')
+                yield (f'{patient_name}/priority', 5, f'patient {patient_name} has invalid priority')
         
         if 'protocols' not in patient or type(patient['protocols']) is not dict:
-            return (6, f'patient {patient_name} has invalid protocols')
+            yield (f'{patient_name}/protocols', 6, f'patient {patient_name} has invalid protocols')
+            continue
         
         for protocol_name, protocol in patient['protocols'].items():
 
-            if 'initial_shift' not in protocol or type(protocol['initial_shift']) is not int:
-                return (7, f'protocol {protocol_name} of patient {patient_name} has invalid initial_shift')
+            path = f'{patient_name}/protocols/{protocol_name}'
+
+            if type(protocol) is not dict:
+                yield (f'{path}/initial_shift', 7, f'protocol {protocol_name} of patient {patient_name} has invalid initial_shift')
+                continue
+
+            is_initial_shift_valid = 'initial_shift' in protocol and type(protocol['initial_shift']) is int
+            if not is_initial_shift_valid:
+                yield (f'{path}/initial_shift', 7, f'protocol {protocol_name} of patient {patient_name} has invalid initial_shift')
             if 'protocol_services' not in protocol or type(protocol['protocol_services']) is not list:
-                return (8, f'protocol {protocol_name} of patient {patient_name} has invalid protocol_services')
+                yield (f'{path}/protocol_services', 8, f'protocol {protocol_name} of patient {patient_name} has invalid protocol_services')
+                continue
             
-            for protocol_service in protocol['protocol_services']:
+            for protocol_service_index, protocol_service in enumerate(protocol['protocol_services']):
+
+                protocol_service_path = f'{path}/protocol_services/{protocol_service_index}'
             
                 if type(protocol_service) is not dict:
-                    return (9, f'protocol {protocol_name} of patient {patient_name} has an invalid protocol service')
+                    yield (protocol_service_path, 9, f'protocol {protocol_name} of patient {patient_name} has an invalid protocol service')
+                    continue
             
+                # the following checks need all the keys with the right type
+                are_keys_valid = True
                 for key in ['service', 'start', 'tolerance', 'frequency', 'times']:
                     if key not in protocol_service:
-                        return (10, f'{key} not in protocol {protocol_name} of patient {patient_name}')
-                    if key != 'service' and type(protocol_service[key]) is not int:
-                        return (11, f'{key} is not an int')
+                        yield (protocol_service_path, 10, f'{key} not in protocol {protocol_name} of patient {patient_name}')
+                        are_keys_valid = False
+                    elif key != 'service' and type(protocol_service[key]) is not int:
+                        yield (f'{protocol_service_path}/{key}', 11, f'{key} is not an int')
+                        are_keys_valid = False
+                if not are_keys_valid:
+                    continue
             
                 if type(protocol_service['service']) is not str or len(protocol_service['service']) <= 0 or protocol_service['service'] not in service_names:
-                    return (12, f'service name {protocol_service["service"]} is not valid in protocol {protocol_name} of patient {patient_name}')
+                    yield (f'{protocol_service_path}/service', 12, f'service name {protocol_service["service"]} is not valid in protocol {protocol_name} of patient {patient_name}')
                 
                 if protocol_service['tolerance'] < 0:
-                    return (13, f'tolerance {protocol_service["tolerance"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
+                    yield (f'{protocol_service_path}/tolerance', 13, f'tolerance {protocol_service["tolerance"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
                 if protocol_service['frequency'] < 0:
-                    return (14, f'frequency {protocol_service["frequency"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
+                    yield (f'{protocol_service_path}/frequency', 14, f'frequency {protocol_service["frequency"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
                 if protocol_service['times'] < 1:
-                    return (15, f'times {protocol_service["times"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
+                    yield (f'{protocol_service_path}/times', 15, f'times {protocol_service["times"]} is not valid in service {protocol_service["service"]} protocol {protocol_name} of patient {patient_name}')
                 
+                if not is_initial_shift_valid:
+                    continue
+
                 if protocol_service['start'] + protocol['initial_shift'] + protocol_service['tolerance'] < min_day:
-                    return (16, f'service {protocol_service["service"]} in protocol {protocol_name} of patient {patient_name} starts too early')
+                    yield (protocol_service_path, 16, f'service {protocol_service["service"]} in protocol {protocol_name} of patient {patient_name} starts too early')
                 if protocol_service['start'] + protocol['initial_shift'] + (protocol_service['times'] - 1) * protocol_service['frequency'] - protocol_service['tolerance'] > max_day:
-                    return (17, f'service {protocol_service["service"]} in protocol {protocol_name} of patient {patient_name} ends too late')
+                    yield (protocol_service_path, 17, f'service {protocol_service["service"]} in protocol {protocol_name} of patient {patient_name} ends too late')
 
-    return (0, 'all ok')
+
+def check_patients_validity(patients, service_names, min_day, max_day) -> tuple[int, str]:
+    return get_first_error(find_patients_errors(patients, service_names, min_day, max_day))
 
 
-def check_results_types(results, days) -> tuple[int, str]:
+def find_results_types_errors(results, days):
 
     for day_name, schedule in results['scheduled'].items():
         
         if day_name not in days.keys():
-            return (5, f'day {day_name} does not exist')
+            yield (f'scheduled/{day_name}', 5, f'day {day_name} does not exist')
+            continue
         if type(schedule) is not list:
-            return (1, f'schedule {schedule} is not a list')
+            yield (f'scheduled/{day_name}', 1, f'schedule {schedule} is not a list')
+            continue
         
-        for schedule_item in schedule:
+        for schedule_index, schedule_item in enumerate(schedule):
+
+            path = f'scheduled/{day_name}/{schedule_index}'
+
+            # the following checks need all the keys with the right type
+            are_keys_valid = True
             for key in ['patient', 'service', 'care_unit', 'operator', 'time']:
                 if key not in schedule_item:
-                    return (2, f'{key} not in results schedule')
-                if key != 'time' and type(schedule_item[key]) is not str:
-                    return (3, f'{key} is not a string in results schedule')
+                    yield (path, 2, f'{key} not in results schedule')
+                    are_keys_valid = False
+                elif key != 'time' and type(schedule_item[key]) is not str:
+                    yield (f'{path}/{key}', 3, f'{key} is not a string in results schedule')
+                    are_keys_valid = False
+            if not are_keys_valid:
+                continue
             
             if type(schedule_item['time']) is not int:
-                return (4, f'time is not an int in results schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]}')
+                yield (f'{path}/time', 4, f'time is not an int in results schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]}')
             
             if schedule_item['care_unit'] not in days[day_name].keys():
-                return (6, f'care unit {schedule_item["care_unit"]} of schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]} does not exist')
-            if schedule_item['operator'] not in days[day_name][schedule_item['care_unit']].keys():
-                return (7, f'operator {schedule_item["operator"]} of schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]} does not exist')
+                yield (f'{path}/care_unit', 6, f'care unit {schedule_item["care_unit"]} of schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]} does not exist')
+            elif schedule_item['operator'] not in days[day_name][schedule_item['care_unit']].keys():
+                yield (f'{path}/operator', 7, f'operator {schedule_item["operator"]} of schedule of patient{schedule_item["patient"]} of service {schedule_item["service"]} does not exist')
 
-    return (0, 'all ok')
 
+def check_results_types(results, days) -> tuple[int, str]:
+    return get_first_error(find_results_types_errors(results, days))
+
+
+def get_overlap_message(day_name, schedule, other_schedule) -> str:
+    return f'schedules ({schedule["service"]}, {schedule["patient"]}, {day_name}, {schedule["care_unit"]}, {schedule["operator"]}) and ({other_schedule["service"]}, {other_schedule["patient"]}, {day_name}, {other_schedule["care_unit"]}, {other_schedule["operator"]}) overlaps'
 
-def check_results_overlapping(results, services) -> tuple[int, str]:
+
+def find_results_overlaps(results, services):
 
     for day_name, day_schedule in results['scheduled'].items():
 
-        for index in range(len(day_schedule) - 1):
-            schedule = day_schedule[index]
+        # schedule indexes grouped by patient and by operator: only schedules
+        # in the same group can overlap
+        schedule_groups = {}
+        for index, schedule in enumerate(day_schedule):
+            for key in [(schedule['patient'],), (schedule['care_unit'], schedule['operator'])]:
+                if key not in schedule_groups:
+                    schedule_groups[key] = []
+                schedule_groups[key].append(index)
 
-            for other_index in range(index + 1, len(day_schedule)):
-                other_schedule = day_schedule[other_index]
-                
-                is_same_patient = (schedule['patient'] == other_schedule['patient'])
-                is_same_operator = (schedule['care_unit'] == other_schedule['care_unit'] and
-                                    schedule['operator'] == other_schedule['operator'])
-                
-                if not is_same_patient and not is_same_operator:
-                    continue
+        # couples of indexes (index, other_index) of overlapping schedules
+        overlapping_indexes = set()
 
-                start = schedule['time']
-                end = schedule['time'] + services[schedule['service']]['duration']
+        for indexes in schedule_groups.values():
 
-                other_start = other_schedule['time']
-                other_end = other_schedule['time'] + services[other_schedule['service']]['duration']
+            intervals = []
+            for index in indexes:
+                start = day_schedule[index]['time']
+                end = start + services[day_schedule[index]['service']]['duration']
+                intervals.append((start, end, index))
+            intervals.sort()
 
-                if (start <= other_start and end > other_start) or (other_start <= start and other_end > start):
-                    return (1, f'schedules ({schedule["service"]}, {schedule["patient"]}, {day_name}, {schedule["care_unit"]}, {schedule["operator"]}) and ({other_schedule["service"]}, {other_schedule["patient"]}, {day_name}, {other_schedule["care_unit"]}, {other_schedule["operator"]}) overlaps')
+            # sweep the intervals by start time, keeping an heap of the (end, index)
+            # of the ones not yet ended: each of them overlaps the current interval
+            active_intervals = []
+            for start, end, index in intervals:
 
-    return (0, 'all ok')
+                while len(active_intervals) > 0 and active_intervals[0][0] <= start:
+                    heapq.heappop(active_intervals)
 
+                for _, other_index in active_intervals:
+                    overlapping_indexes.add((min(index, other_index), max(index, other_index)))
 
-def check_results_operator_range(results, services, days) -> tuple[int, str]:
+                heapq.heappush(active_intervals, (end, index))
+
+        # overlaps of a day are given in the order of the schedule
+        for index, other_index in sorted(overlapping_indexes):
+            yield (f'scheduled/{day_name}/{index}', 1, get_overlap_message(day_name, day_schedule[index], day_schedule[other_index]))
+
+
+def check_results_overlapping(results, services) -> tuple[int, str]:
+    return get_first_error(find_results_overlaps(results, services))
+
+
+def find_results_operator_range_errors(results, services, days):
     
     for day_name, day in results['scheduled'].items():
-        for schedule in day:
+        for schedule_index, schedule in enumerate(day):
 
             patient_name = schedule['patient']
             service_name = schedule['service']
@@ -242,163 +335,259 @@ def check_results_operator_range(results, services, days) -> tuple[int, str]:
             service_end = service_start + service_duration
             
             if service_start < operator_start or service_end > operator_end:
-                return (1, f'service {service_name} of patient {patient_name} satisfied in day {day_name} is done outside operator range.')
+                yield (f'scheduled/{day_name}/{schedule_index}', 1, f'service {service_name} of patient {patient_name} satisfied in day {day_name} is done outside operator range.')
 
-    return (0, 'all ok')
 
+def check_results_operator_range(results, services, days) -> tuple[int, str]:
+    return get_first_error(find_results_operator_range_errors(results, services, days))
 
-def check_results_windows_existance(results, patients) -> tuple[int, str]:
-    
-    for day_name, day in results['scheduled'].items():
-        day_index = int(day_name)
 
-        for schedule in day:
+def get_windows_index(patients) -> dict[tuple[str, str], list[tuple[int, int, int]]]:
 
-            patient_name = schedule['patient']
-            service_name = schedule['service']
+    # all the request windows (start, end) of each (patient, service), sorted.
+    # They are not taken from solvers/tools.get_request_windows, that would
+    # make the checker depend on pyomo
+    windows_per_request = {}
 
-            is_inside_a_window = False
+    for patient_name, patient in patients.items():
+        for protocol in patient['protocols'].values():
+            initial_shift = protocol['initial_shift']
+            for protocol_service in protocol['protocol_services']:
 
-            for protocol in patients[patient_name]['protocols'].values():
-                initial_shift = protocol['initial_shift']
-                for protocol_service in protocol['protocol_services']:
-                    if protocol_service['service'] != service_name:
-                        continue
+                key = (patient_name, protocol_service['service'])
+                if key not in windows_per_request:
+                    windows_per_request[key] = []
 
-                    window_start = protocol_service['start'] + initial_shift - protocol_service['tolerance']
+                window_start = protocol_service['start'] + initial_shift - protocol_service['tolerance']
+                for _ in range(protocol_service['times']):
+                    windows_per_request[key].append((window_start, window_start + 2 * protocol_service['tolerance']))
+                    window_start += protocol_service['frequency']
 
-                    for _ in range(protocol_service['times']):
-                        if day_index >= window_start and day_index <= window_start + 2 * protocol_service['tolerance']:
-                            is_inside_a_window = True
-                            break
+    # each window is stored as (start, end, max_end), where 'max_end' is the
+    # greatest end between this window and the previous ones. A day is inside
+    # some window if the last window starting before it has 'max_end' after it
+    windows_index = {}
+    for key, windows in windows_per_request.items():
+        windows.sort()
+        windows_index[key] = []
+        max_end = None
+        for window_start, window_end in windows:
+            if max_end is None or window_end > max_end:
+                max_end = window_end
+            windows_index[key].append((window_start, window_end, max_end))
 
-                        window_start += protocol_service['frequency']
+    return windows_index
 
-                    if is_inside_a_window:
-                        break
-                if is_inside_a_window:
-                    break
 
-            if not is_inside_a_window:
-                return (1, f'service {service_name} of patient {patient_name} requested in day {day_name} is done outside any request window')
+def is_day_inside_windows(windows, day_index: int) -> bool:
+    position = bisect.bisect_right(windows, (day_index, math.inf, math.inf))
+    return position > 0 and windows[position - 1][2] >= day_index
 
-    return (0, 'all ok')
 
+def find_results_windows_errors(results, patients, windows_index=None):
+
+    # the index can be built once and shared between checks
+    if windows_index is None:
+        windows_index = get_windows_index(patients)
+
+    for day_name, day in results['scheduled'].items():
+        day_index = int(day_name)
+
+        for schedule_index, schedule in enumerate(day):
+
+            patient_name = schedule['patient']
+            service_name = schedule['service']
+
+            if not is_day_inside_windows(windows_index.get((patient_name, service_name), []), day_index):
+                yield (f'scheduled/{day_name}/{schedule_index}', 1, f'service {service_name} of patient {patient_name} requested in day {day_name} is done outside any request window')
 
-def check_results_validity(results, instance) -> tuple[int, str]:
+
+def check_results_windows_existance(results, patients, windows_index=None) -> tuple[int, str]:
+    return get_first_error(find_results_windows_errors(results, patients, windows_index))
+
+
+def find_results_errors(results, instance, windows_index=None):
     
+    are_keys_present = True
     for key in ['scheduled', 'rejected']:
         if key not in results:
-            return (1, f'{key} not in results')
+            yield ('', 1, f'{key} not in results')
+            are_keys_present = False
+    if not are_keys_present:
+        return
     if type(results['scheduled']) is not dict:
-        return (2, f'result\'s {key} is not an object')
+        yield ('scheduled', 2, f'result\'s scheduled is not an object')
+        return
     if type(results['rejected']) is not list:
-        return (2, f'result\'s {key} is not a list')
+        yield ('rejected', 2, f'result\'s rejected is not a list')
     
-    error_code, error_message = check_results_types(results, instance['days'])
-    if error_code != 0:
-        return (error_code, error_message)
+    # the other checks need a schedule with valid types
+    are_types_valid = True
+    for error in find_results_types_errors(results, instance['days']):
+        are_types_valid = False
+        yield error
+    if not are_types_valid:
+        return
     
-    error_code, error_message = check_results_overlapping(results, instance['services'])
-    if error_code != 0:
-        return (error_code, error_message)
-    
-    error_code, error_message = check_results_operator_range(results, instance['services'], instance['days'])
-    if error_code != 0:
-        return (error_code, error_message)
+    yield from find_results_overlaps(results, instance['services'])
+    yield from find_results_operator_range_errors(results, instance['services'], instance['days'])
+    yield from find_results_windows_errors(results, instance['patients'], windows_index)
+
+
+def check_results_validity(results, instance, windows_index=None) -> tuple[int, str]:
+    return get_first_error(find_results_errors(results, instance, windows_index))
+
+
+def find_day_templates_errors(instance):
+
+    if type(instance['day_templates']) is not list:
+        yield ('day_templates', 1, 'day_templates is not a list')
+        return
     
-    error_code, error_message = check_results_windows_existance(results, instance['patients'])
-    if error_code != 0:
-        return (error_code, error_message)
+    # wrong days are found by the days check
+    if type(instance['days']) is not dict:
+        return
     
-    return (0, 'all ok')
+    for day_name, template_index in instance['days'].items():
+        if type(template_index) is not int or template_index < 0 or template_index >= len(instance['day_templates']):
+            yield (f'days/{day_name}', 1, f'day {day_name} has an invalid template index')
 
 
-def check_master_validity(instance, results=None) -> tuple[int, str]:
+def find_master_errors(instance, results=None):
 
     # check for key presence
+    are_keys_present = True
     for key in ['services', 'days', 'patients']:
         if key not in instance:
-            return (1, f'{key} not in instance')
+            yield ('', 1, f'{key} not in instance')
+            are_keys_present = False
+    if not are_keys_present:
+        return
     
-    error_code, error_message = check_days_validity(instance['days'])
-    if error_code != 0:
-        return (2, error_message)
+    # compact instances are checked with their days written in full
+    if 'day_templates' in instance:
+        are_templates_valid = True
+        for error in find_day_templates_errors(instance):
+            are_templates_valid = False
+            yield error
+        if not are_templates_valid:
+            return
+        if type(instance['days']) is dict:
+            instance = get_expanded_instance(instance)
+    
+    # every other check needs valid days
+    are_days_valid = True
+    for path, error_code, error_message in find_days_errors(instance['days']):
+        are_days_valid = False
+        yield (f'days/{path}'.removesuffix('/'), 2, error_message)
+    if not are_days_valid:
+        return
 
     # get all care unit names offered at least once in a day
     care_unit_names = set()
     for day in instance['days'].values():
         care_unit_names.update(day.keys())
     
-    error_code, error_message = check_services_validity(instance['services'], care_unit_names)
-    if error_code != 0:
-        return (3, error_message)
+    is_instance_valid = True
+    for path, error_code, error_message in find_services_errors(instance['services'], care_unit_names):
+        is_instance_valid = False
+        yield (f'services/{path}'.removesuffix('/'), 3, error_message)
     
     # get all service names offered at least once in a day
-    service_names = set(instance['services'].keys())
+    service_names = set(instance['services'].keys()) if type(instance['services']) is dict else set()
 
     day_indexes = [int(day_name) for day_name in instance['days'].keys()]
-    min_day = min(day_indexes)
-    max_day = max(day_indexes)
+    min_day = min(day_indexes, default=0)
+    max_day = max(day_indexes, default=0)
         
-    error_code, error_message = check_patients_validity(instance['patients'], service_names, min_day, max_day)
-    if error_code != 0:
-        return (4, error_message)
-
-    if results is not None:
-        error_code, error_message = check_results_validity(results, instance)
-        if error_code != 0:
-            return (5, error_message)
-    
-    return (0, 'all ok')
+    for path, error_code, error_message in find_patients_errors(instance['patients'], service_names, min_day, max_day):
+        is_instance_valid = False
+        yield (f'patients/{path}'.removesuffix('/'), 4, error_message)
 
+    # results are checked only against a valid instance
+    if results is not None and is_instance_valid:
+        windows_index = get_windows_index(instance['patients'])
+        for path, error_code, error_message in find_results_errors(results, instance, windows_index):
+            yield (f'results/{path}'.removesuffix('/'), 5, error_message)
 
-def check_requests_validity(requests, service_names) -> tuple[int, str]:
+
+def check_master_validity(instance, results=None, collect_all: bool = False) -> tuple[int, str] | list[tuple[str, int, str]]:
+
+    # if 'collect_all' is set, the list of all (path, error_code, error_message)
+    # records is returned, otherwise only the first (error_code, error_message)
+    if collect_all:
+        return list(find_master_errors(instance, results))
+
+    return get_first_error(find_master_errors(instance, results))
+
+
+def find_requests_errors(requests, service_names):
 
     if type(requests) is not list:
-        return (1, 'requests is not a list')
+        yield ('', 1, 'requests is not a list')
+        return
     
-    for request in requests:
+    for request_index, request in enumerate(requests):
 
         if type(request) is not dict:
-            return (2, 'request item is not an object')
+            yield (str(request_index), 2, 'request item is not an object')
+            continue
         
+        are_keys_valid = True
         for key in ['patient', 'service']:
             
             if key not in request:
-                return (3, f'{key} not in request object')
-            if type(request[key]) is not str:
-                return (4, f'{key} value is not a string')
-            
-        if request['service'] not in service_names:
-            return (5, f'service {request["service"]} is not in services')
-    
-    return (0, 'all ok')
+                yield (str(request_index), 3, f'{key} not in request object')
+                are_keys_valid = False
+            elif type(request[key]) is not str:
+                yield (f'{request_index}/{key}', 4, f'{key} value is not a string')
+                are_keys_valid = False
+        
+        if are_keys_valid and request['service'] not in service_names:
+            yield (f'{request_index}/service', 5, f'service {request["service"]} is not in services')
+
+
+def check_requests_validity(requests, service_names) -> tuple[int, str]:
+    return get_first_error(find_requests_errors(requests, service_names))
 
 
-def check_subproblem_validity(instance, results=None) -> tuple[int, str]:
+def find_subproblem_errors(instance, results=None):
     
     # check for key presence
+    are_keys_present = True
     for key in ['services', 'day', 'requests']:
         if key not in instance:
-            return (1, f'{key} not in instance')
+            yield ('', 1, f'{key} not in instance')
+            are_keys_present = False
+    if not are_keys_present:
+        return
     
-    error_code, error_message = check_day_validity(instance['day'])
-    if error_code != 0:
-        return (2, error_message)
+    # every other check needs a valid day
+    is_day_valid = True
+    for path, error_code, error_message in find_day_errors(instance['day']):
+        is_day_valid = False
+        yield (f'day/{path}'.removesuffix('/'), 2, error_message)
+    if not is_day_valid:
+        return
 
     # get all care unit names offered
     care_unit_names = set(instance['day'].keys())
     
-    error_code, error_message = check_services_validity(instance['services'], care_unit_names)
-    if error_code != 0:
-        return (3, error_message)
+    for path, error_code, error_message in find_services_errors(instance['services'], care_unit_names):
+        yield (f'services/{path}'.removesuffix('/'), 3, error_message)
     
     # get all service names offered at least once in a day
-    service_names = set(instance['services'].keys())
+    service_names = set(instance['services'].keys()) if type(instance['services']) is dict else set()
 
-    error_code, error_message = check_requests_validity(instance['requests'], service_names)
-    if error_code != 0:
-        return (4, error_message)
-    
-    return (0, 'all ok')
\ No newline at end of file
+    for path, error_code, error_message in find_requests_errors(instance['requests'], service_names):
+        yield (f'requests/{path}'.removesuffix('/'), 4, error_message)
+
+
+def check_subproblem_validity(instance, results=None, collect_all: bool = False) -> tuple[int, str] | list[tuple[str, int, str]]:
+
+    # if 'collect_all' is set, the list of all (path, error_code, error_message)
+    # records is returned, otherwise only the first (error_code, error_message)
+    if collect_all:
+        return list(find_subproblem_errors(instance, results))
+
+    return get_first_error(find_subproblem_errors(instance, results))
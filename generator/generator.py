@@ -3,139 +3,185 @@ from pathlib import Path
 import yaml
 import shutil
 import random
-import json
+import sys
 from datetime import datetime
 import time
+from concurrent.futures import ProcessPoolExecutor
 
-from tools import generate_master_instance, generate_subproblem_instance
+from tools import generate_master_instance, generate_subproblem_instance, get_compact_instance
+
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from json_tools import write_json
 
 try:
     from yaml import CLoader as Loader
 except ImportError:
     from yaml import Loader
 
-parser = argparse.ArgumentParser(prog='Master generator', description='This program is used to generate random intances for the master or subproblem')
-parser.add_argument('-c', '--config', type=Path, help='Configuration file path', required=True)
-parser.add_argument('-o', '--output', type=Path, help='Output path', required=True)
-parser.add_argument('-d', '--delete-prev', help='Remove previous instance data in the output location', action='store_true')
-parser.add_argument('-v', '--verbose', action='store_true')
-args = parser.parse_args()
 
-config_path = Path(args.config).resolve()
-output_folder_path = Path(args.output).resolve()
+def generate_instance_file(group_config, instance_index, instance_path, include_info, is_compact, use_day_templates):
 
-delete_prev = bool(args.delete_prev)
-is_verbose = bool(args.verbose)
+    # each instance has its own random stream derived from the group seed, so
+    # the same instances are generated whatever the number of jobs
+    random.seed(f'{group_config["seed"]}_{instance_index}')
 
-# checks for configuration file existance and validity
-if not config_path.exists():
-    print('Configuration file not found')
-    exit(1)
+    # if protocol info is provided then it's a master instance
+    if 'protocol' in group_config:
+        instance = generate_master_instance(group_config)
+    else:
+        instance = generate_subproblem_instance(group_config)
+    
+    # master instances can store each distinct day only once
+    if use_day_templates and 'days' in instance:
+        instance = get_compact_instance(instance)
 
-if config_path.is_dir() or not config_path.is_file():
-    print('Configuration must be a file')
-    exit(1)
+    # if specified, add the configuration infos in the instance file
+    if include_info:
+        instance['info'] = group_config
+    
+    # write to file the current instance
+    write_json(instance_path, instance, is_compact)
+    
+    return instance_path
 
-if config_path.suffix != '.yaml':
-    print('Configuration file must be YAML')
-    exit(1)
 
-if output_folder_path.exists() and not output_folder_path.is_dir():
-    print('The output must be a folder name')
-    exit(1)
+if __name__ == '__main__':
 
-# read configuration file
-with open(config_path, 'r') as file:
-    config = yaml.load(file, Loader)
+    parser = argparse.ArgumentParser(prog='Master generator', description='This program is used to generate random intances for the master or subproblem')
+    parser.add_argument('-c', '--config', type=Path, help='Configuration file path', required=True)
+    parser.add_argument('-o', '--output', type=Path, help='Output path', required=True)
+    parser.add_argument('-d', '--delete-prev', help='Remove previous instance data in the output location', action='store_true')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of instances generated in parallel')
+    parser.add_argument('--compact', action='store_true', help='Write instances without indentation')
+    parser.add_argument('--day-templates', action='store_true', help='Store each distinct day of master instances only once')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
 
-if is_verbose:
-    print(f'Read config file in {config_path}')
+    config_path = Path(args.config).resolve()
+    output_folder_path = Path(args.output).resolve()
 
-# eventual default setting of missing parameters
-if 'include_info_in_instances' not in config:
-    config['include_info_in_instances'] = False
+    delete_prev = bool(args.delete_prev)
+    is_verbose = bool(args.verbose)
+    jobs = max(1, int(args.jobs))
+    is_compact = bool(args.compact)
+    use_day_templates = bool(args.day_templates)
 
-if 'include_info_in_group_folder' not in config:
-    config['include_info_in_group_folder'] = False
+    # checks for configuration file existance and validity
+    if not config_path.exists():
+        print('Configuration file not found')
+        exit(1)
 
-random.seed(42)
-group_index = 0
-for group_config in config['groups']:
+    if config_path.is_dir() or not config_path.is_file():
+        print('Configuration must be a file')
+        exit(1)
 
-    if 'seed' not in group_config:
-        group_config['seed'] = random.randint(1, 1000)
-    
-    if 'instance_number' not in group_config:
-        group_config['instance_number'] = 1
-    
-    if 'instance_group_folder_name' not in group_config:
-        group_config['instance_group_folder_name'] = f'group_{group_index}'
-        group_index += 1
+    if config_path.suffix != '.yaml':
+        print('Configuration file must be YAML')
+        exit(1)
 
-# eventual deletion of previous data
-if delete_prev and output_folder_path.exists():
+    if output_folder_path.exists() and not output_folder_path.is_dir():
+        print('The output must be a folder name')
+        exit(1)
 
-    shutil.rmtree(output_folder_path)
+    # read configuration file
+    with open(config_path, 'r') as file:
+        config = yaml.load(file, Loader)
 
     if is_verbose:
-        print(f'Deleted stuff, if present, in {output_folder_path}')
+        print(f'Read config file in {config_path}')
 
-# if not present, create the output directory
-if not output_folder_path.exists():
+    # eventual default setting of missing parameters
+    if 'include_info_in_instances' not in config:
+        config['include_info_in_instances'] = False
 
-    output_folder_path.mkdir()
+    if 'include_info_in_group_folder' not in config:
+        config['include_info_in_group_folder'] = False
 
-    if is_verbose:
-        print(f'Created new folder {output_folder_path}')
+    random.seed(42)
+    group_index = 0
+    for group_config in config['groups']:
 
-timestamp = datetime.now().strftime('%a_%d_%m_%Y_%H_%M_%S')
+        if 'seed' not in group_config:
+            group_config['seed'] = random.randint(1, 1000)
 
-if is_verbose:
-    print(f'{timestamp} will be used as timestamp in those instances')
-    total_instance_number = 0
-    start_time = time.perf_counter()
+        if 'instance_number' not in group_config:
+            group_config['instance_number'] = 1
 
-# generate each group
-for group_config in config['groups']:
+        if 'instance_group_folder_name' not in group_config:
+            group_config['instance_group_folder_name'] = f'group_{group_index}'
+            group_index += 1
 
-    group_config['timestamp'] = timestamp
+    # eventual deletion of previous data
+    if delete_prev and output_folder_path.exists():
+
+        shutil.rmtree(output_folder_path)
 
-    # creation of the group directory
-    group_path = output_folder_path.joinpath(group_config['instance_group_folder_name'])
-    if not group_path.exists():
-        group_path.mkdir()
         if is_verbose:
-            print(f'Created new folder {group_path}')
-    
-    # if specified, add the configuration file in the group directory
-    if config['include_info_in_group_folder'] is True:
-        with open(group_path.joinpath('info.yaml'), 'w') as file:
-            yaml.dump(group_config, file, default_flow_style=False)
-    
-    # each group instance will use the same seed
-    random.seed(group_config['seed'])
-
-    # generate each instance
-    for instance_index in range(group_config['instance_number']):
-
-        # if protocol info is provided then it's a master instance
-        if 'protocol' in group_config:
-            instance = generate_master_instance(group_config)
-        else:
-            instance = generate_subproblem_instance(group_config)
-        
-        # if specified, add the configuration infos in the instance file
-        if config['include_info_in_instances'] is True:
-            instance['info'] = group_config
-        
-        # write to file the current instance
-        instance_path = group_path.joinpath(f'instance_{instance_index}.json')
-        with open(instance_path, 'w') as file:
-            json.dump(instance, file, indent=4)
-    
+            print(f'Deleted stuff, if present, in {output_folder_path}')
+
+    # if not present, create the output directory
+    if not output_folder_path.exists():
+
+        output_folder_path.mkdir()
+
+        if is_verbose:
+            print(f'Created new folder {output_folder_path}')
+
+    timestamp = datetime.now().strftime('%a_%d_%m_%Y_%H_%M_%S')
+
     if is_verbose:
-        print(f'Created {group_config["instance_number"]} instances in group {group_path}')
-        total_instance_number += group_config['instance_number']
+        print(f'{timestamp} will be used as timestamp in those instances')
+        total_instance_number = 0
+        start_time = time.perf_counter()
+
+    # instances of all groups, in order
+    group_configs = []
+    instance_indexes = []
+    instance_paths = []
+
+    # prepare each group
+    for group_config in config['groups']:
+
+        group_config['timestamp'] = timestamp
+
+        # creation of the group directory
+        group_path = output_folder_path.joinpath(group_config['instance_group_folder_name'])
+        if not group_path.exists():
+            group_path.mkdir()
+            if is_verbose:
+                print(f'Created new folder {group_path}')
+
+        # if specified, add the configuration file in the group directory
+        if config['include_info_in_group_folder'] is True:
+            with open(group_path.joinpath('info.yaml'), 'w') as file:
+                yaml.dump(group_config, file, default_flow_style=False)
+
+        for instance_index in range(group_config['instance_number']):
+            group_configs.append(group_config)
+            instance_indexes.append(instance_index)
+            instance_paths.append(group_path.joinpath(f'instance_{instance_index}.json'))
+
+    task_number = len(instance_paths)
+    include_info = config['include_info_in_instances'] is True
+
+    # generate each instance, writing it as soon as it's done
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        written_paths = executor.map(generate_instance_file, group_configs, instance_indexes, instance_paths, [include_info] * task_number, [is_compact] * task_number, [use_day_templates] * task_number, chunksize=max(1, min(64, task_number // (jobs * 4))))
+    else:
+        executor = None
+        written_paths = map(generate_instance_file, group_configs, instance_indexes, instance_paths, [include_info] * task_number, [is_compact] * task_number, [use_day_templates] * task_number)
+
+    # instances are written in order, so a group is done with its last instance
+    for group_config, instance_index, instance_path in zip(group_configs, instance_indexes, written_paths):
+
+        if is_verbose and instance_index == group_config['instance_number'] - 1:
+            print(f'Created {group_config["instance_number"]} instances in group {instance_path.parent}')
+            total_instance_number += group_config['instance_number']
+
+    if executor is not None:
+        executor.shutdown()
 
-if is_verbose:
-    print(f'Created {total_instance_number} instances in total. Took {time.perf_counter() - start_time} seconds.\nDone.')
\ No newline at end of file
+    if is_verbose:
+        print(f'Created {total_instance_number} instances in total. Took {time.perf_counter() - start_time} seconds.\nDone.')
@@ -1,4 +1,5 @@
 import random
+import json
 
 
 def generate_value(config):
@@ -266,6 +267,33 @@ def generate_patient(config, protocol_pool=None, services=None):
         }
 
 
+def get_compact_instance(instance):
+
+    # each distinct day is stored once in 'day_templates', while 'days' maps
+    # each day name to its template index
+    template_indexes = {}
+    day_templates = []
+    days = {}
+
+    for day_name, day in instance['days'].items():
+
+        # equal days, like the ones repeated by the 'all_same' and
+        # 'repeat_week' strategies, share the same template
+        day_key = json.dumps(day, sort_keys=True)
+
+        if day_key not in template_indexes:
+            template_indexes[day_key] = len(day_templates)
+            day_templates.append(day)
+        
+        days[day_name] = template_indexes[day_key]
+    
+    compact_instance = dict(instance)
+    compact_instance['day_templates'] = day_templates
+    compact_instance['days'] = days
+
+    return compact_instance
+
+
 def generate_master_instance(config):
 
     instance = {
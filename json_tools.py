@@ -0,0 +1,64 @@
+import json
+
+# the fastest JSON library installed is used for reading and compact writing,
+# falling back to the standard one
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def read_json(path):
+
+    if orjson is not None:
+        with open(path, 'rb') as file:
+            return orjson.loads(file.read())
+
+    if ujson is not None:
+        with open(path, 'r') as file:
+            return ujson.load(file)
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def get_expanded_instance(instance):
+
+    # compact instances store each distinct day once in 'day_templates', with
+    # 'days' mapping each day name to its template index
+    if 'day_templates' not in instance:
+        return instance
+
+    expanded_instance = {key: value for key, value in instance.items() if key != 'day_templates'}
+    expanded_instance['days'] = {day_name: instance['day_templates'][template_index] for day_name, template_index in instance['days'].items()}
+
+    return expanded_instance
+
+
+def write_json(path, data, compact=False):
+
+    # indented files are always written by the standard library, so that they
+    # keep the same 4 spaces indentation whatever library is installed
+    if not compact:
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=4)
+        return
+
+    # compact files have no whitespace at all
+    if orjson is not None:
+        with open(path, 'wb') as file:
+            file.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+        return
+
+    if ujson is not None:
+        with open(path, 'w') as file:
+            ujson.dump(data, file, indent=0, escape_forward_slashes=False)
+        return
+
+    with open(path, 'w') as file:
+        json.dump(data, file, separators=(',', ':'))
@@ -1,13 +1,43 @@
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from os import cpu_count
 from time import perf_counter
-from json import load, dump
+from json import dumps
+from hashlib import sha256
 from pathlib import Path
 import pyomo.environ as pyo
 
 from pyomo.environ import ConcreteModel, maximize
 from pyomo.environ import Set, Var, Objective, Constraint, ConstraintList
 from pyomo.environ import Boolean, NonNegativeReals, NonNegativeIntegers
-from pyomo.environ import SolverFactory
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
+
+from solvers.tools import get_greedy_schedule, get_operator_equivalence_classes
+from solvers.tools import get_solver, solve_model, get_solver_info
+from json_tools import read_json, write_json, get_expanded_instance
+
+def get_chi_index_groups(chi_indexes):
+
+    # chi tuples (patient, service, operator, care_unit) bucketed by request
+    # (patient, service) and by operator (operator, care_unit); each bucket
+    # keeps the same relative order of 'chi_indexes'
+    chi_indexes_per_request = {}
+    chi_indexes_per_operator = {}
+
+    for patient_name, service_name, operator_name, care_unit_name in chi_indexes:
+
+        request_key = (patient_name, service_name)
+        if request_key not in chi_indexes_per_request:
+            chi_indexes_per_request[request_key] = []
+        chi_indexes_per_request[request_key].append((patient_name, service_name, operator_name, care_unit_name))
+
+        operator_key = (operator_name, care_unit_name)
+        if operator_key not in chi_indexes_per_operator:
+            chi_indexes_per_operator[operator_key] = []
+        chi_indexes_per_operator[operator_key].append((patient_name, service_name, operator_name, care_unit_name))
+
+    return (chi_indexes_per_request, chi_indexes_per_operator)
 
 def get_milp_basic_model(instance):
     
@@ -43,12 +73,21 @@ def get_milp_basic_model(instance):
             if is_service_satisfiable:
                 x_indexes.append((patient_name, service_name))
 
+    chi_indexes_per_request, _ = get_chi_index_groups(chi_indexes)
+
+    # x_indexes are already grouped by patient, being generated one patient at a time
+    x_indexes_per_patient = {}
+    for patient_name, service_name in x_indexes:
+        if patient_name not in x_indexes_per_patient:
+            x_indexes_per_patient[patient_name] = []
+        x_indexes_per_patient[patient_name].append(service_name)
+
     # aux1_indexes are (patient, service1, service2)
     aux1_indexes = []
-    for index1 in range(len(x_indexes) - 1):
-        for index2 in range(index1 + 1, len(x_indexes)):
-            if x_indexes[index1][0] == x_indexes[index2][0]:
-                aux1_indexes.append((x_indexes[index1][0], x_indexes[index1][1], x_indexes[index2][1]))
+    for patient_name, service_names in x_indexes_per_patient.items():
+        for index1 in range(len(service_names) - 1):
+            for index2 in range(index1 + 1, len(service_names)):
+                aux1_indexes.append((patient_name, service_names[index1], service_names[index2]))
     
     model = ConcreteModel()
 
@@ -87,7 +126,7 @@ def get_milp_basic_model(instance):
     # links toghether x and chi variables
     # when x = 1 then exactly one chi variable of that care unit must be 1
     def f3(model, p, s):
-        return sum(model.chi[p, s, o, c] for pp, ss, o, c in model.chi_indexes if p == pp and s == ss) == model.x[p, s]
+        return sum(model.chi[index] for index in chi_indexes_per_request[(p, s)]) == model.x[p, s]
     model.x_and_chi = Constraint(model.x_indexes, rule=f3)
 
     # operator start and end times must be respected
@@ -131,14 +170,23 @@ def get_milp_std_model(instance):
     model, max_times = get_milp_basic_model(instance)
 
     chi_indexes = list(model.chi_indexes)
+    _, chi_indexes_per_operator = get_chi_index_groups(chi_indexes)
 
-    # aux2_indexes are (patient1, service1, patient2, service2, operator, care_unit, i)
+    # position of each chi tuple inside its operator bucket
+    operator_bucket_positions = {}
+    for bucket in chi_indexes_per_operator.values():
+        for position, chi_index in enumerate(bucket):
+            operator_bucket_positions[chi_index] = position
+
+    # aux2_indexes are (patient1, service1, patient2, service2, operator, care_unit, i).
+    # Only chi tuples of the same operator are paired, following the same
+    # order of a full scan over all chi couples
     aux2_indexes = []
-    for index1 in range(len(chi_indexes) - 1):
-        for index2 in range(index1 + 1, len(chi_indexes)):
-            if chi_indexes[index1][2] == chi_indexes[index2][2] and chi_indexes[index1][3] == chi_indexes[index2][3]:
-                aux2_indexes.append((chi_indexes[index1][0], chi_indexes[index1][1], chi_indexes[index2][0], chi_indexes[index2][1], chi_indexes[index1][2], chi_indexes[index1][3], 0))
-                aux2_indexes.append((chi_indexes[index1][0], chi_indexes[index1][1], chi_indexes[index2][0], chi_indexes[index2][1], chi_indexes[index1][2], chi_indexes[index1][3], 1))
+    for p, s, o, c in chi_indexes:
+        bucket = chi_indexes_per_operator[(o, c)]
+        for pp, ss, _, _ in bucket[operator_bucket_positions[(p, s, o, c)] + 1:]:
+            aux2_indexes.append((p, s, pp, ss, o, c, 0))
+            aux2_indexes.append((p, s, pp, ss, o, c, 1))
 
     model.aux2_indexes = Set(initialize=aux2_indexes)
     model.aux2 = Var(model.aux2_indexes, domain=Boolean)
@@ -164,6 +212,134 @@ def get_milp_std_model(instance):
         return (model.chi[pp, ss, o, c] >= model.aux2[p, s, pp, ss, o, c, 0] + model.aux2[p, s, pp, ss, o, c, 1])
     model.operator_not_overlaps3 = Constraint(model.aux2_indexes, rule=f3)
 
+    # operators with the same start and duration are interchangeable: each one
+    # is linked to the previous operator of its equivalence class
+    previous_equivalent_operators = {}
+    for care_unit_name, care_unit in instance['operators'].items():
+        for operator_names in get_operator_equivalence_classes(care_unit):
+            for index in range(1, len(operator_names)):
+                previous_equivalent_operators[(operator_names[index], care_unit_name)] = operator_names[index - 1]
+
+    # symmetry_indexes are (operator, previous_operator, care_unit)
+    symmetry_indexes = [(o, oo, c) for (o, c), oo in previous_equivalent_operators.items()]
+    model.symmetry_indexes = Set(initialize=symmetry_indexes)
+
+    # interchangeable operators are ordered by their load: the total duration
+    # of the services done by an operator can't exceed the previous one's.
+    # Equivalent operators have the same chi tuples, so any solution can be
+    # relabeled to respect this
+    def f4(model, o, oo, c):
+        operator_load = sum(model.chi[p, s, o, c] * instance['services'][s]['duration'] for p, s, _, _ in chi_indexes_per_operator.get((o, c), []))
+        previous_operator_load = sum(model.chi[p, s, oo, c] * instance['services'][s]['duration'] for p, s, _, _ in chi_indexes_per_operator.get((oo, c), []))
+        if type(operator_load) is int:
+            return Constraint.Skip
+        return operator_load <= previous_operator_load
+    model.operator_symmetry = Constraint(model.symmetry_indexes, rule=f4)
+
+    return model
+
+def get_milp_time_indexed_model(instance):
+
+    # x_indexes are (patient, service)
+    x_indexes = []
+    # y_indexes are (patient, service, operator, care_unit, time_slot) for each
+    # time slot in which an operator can start and complete the service
+    y_indexes = []
+
+    # y tuples grouped by request (patient, service) and by the occupied time
+    # slots of operators (operator, care_unit, time_slot) and patients (patient, time_slot)
+    y_indexes_per_request = {}
+    y_indexes_per_operator_time_slot = {}
+    y_indexes_per_patient_time_slot = {}
+
+    for patient_name, services_requested in instance['requests'].items():
+        for service_name in services_requested:
+
+            care_unit_name = instance['services'][service_name]['care_unit']
+            duration = instance['services'][service_name]['duration']
+
+            for operator_name, operator in instance['operators'][care_unit_name].items():
+                for time_slot in range(operator['start'], operator['start'] + operator['duration'] - duration + 1):
+
+                    y_index = (patient_name, service_name, operator_name, care_unit_name, time_slot)
+                    y_indexes.append(y_index)
+
+                    if (patient_name, service_name) not in y_indexes_per_request:
+                        y_indexes_per_request[(patient_name, service_name)] = []
+                    y_indexes_per_request[(patient_name, service_name)].append(y_index)
+
+                    for occupied_time_slot in range(time_slot, time_slot + duration):
+                        if (operator_name, care_unit_name, occupied_time_slot) not in y_indexes_per_operator_time_slot:
+                            y_indexes_per_operator_time_slot[(operator_name, care_unit_name, occupied_time_slot)] = []
+                        y_indexes_per_operator_time_slot[(operator_name, care_unit_name, occupied_time_slot)].append(y_index)
+                        if (patient_name, occupied_time_slot) not in y_indexes_per_patient_time_slot:
+                            y_indexes_per_patient_time_slot[(patient_name, occupied_time_slot)] = []
+                        y_indexes_per_patient_time_slot[(patient_name, occupied_time_slot)].append(y_index)
+
+            if (patient_name, service_name) in y_indexes_per_request:
+                x_indexes.append((patient_name, service_name))
+
+    # only time slots contended by more than one y tuple need a constraint
+    operator_time_slot_indexes = [k for k, v in y_indexes_per_operator_time_slot.items() if len(v) > 1]
+    patient_time_slot_indexes = [k for k, v in y_indexes_per_patient_time_slot.items() if len(v) > 1]
+
+    # operators with the same start and duration are interchangeable: each one
+    # is linked to the previous operator of its equivalence class
+    symmetry_indexes = []
+    for care_unit_name, care_unit in instance['operators'].items():
+        for operator_names in get_operator_equivalence_classes(care_unit):
+            for index in range(1, len(operator_names)):
+                symmetry_indexes.append((operator_names[index], operator_names[index - 1], care_unit_name))
+
+    y_indexes_per_operator = {}
+    for y_index in y_indexes:
+        if (y_index[2], y_index[3]) not in y_indexes_per_operator:
+            y_indexes_per_operator[(y_index[2], y_index[3])] = []
+        y_indexes_per_operator[(y_index[2], y_index[3])].append(y_index)
+
+    model = ConcreteModel()
+
+    model.x_indexes = Set(initialize=x_indexes)
+    model.y_indexes = Set(initialize=y_indexes)
+    model.operator_time_slot_indexes = Set(initialize=operator_time_slot_indexes)
+    model.patient_time_slot_indexes = Set(initialize=patient_time_slot_indexes)
+    model.symmetry_indexes = Set(initialize=symmetry_indexes)
+
+    # if a service requested from a patient is satisfied
+    model.x = Var(model.x_indexes, domain=Boolean)
+
+    # if a service requested from a patient starts at a time slot with an operator
+    model.y = Var(model.y_indexes, domain=Boolean)
+
+    # maximize the total duration of services done (maximize operator uptime)
+    def objective_function(model):
+        return sum(model.x[p, s] * instance['services'][s]['duration'] for p, s in model.x_indexes)
+    model.objective = Objective(rule=objective_function, sense=maximize)
+
+    # when x = 1 then exactly one y variable must be 1
+    def f1(model, p, s):
+        return sum(model.y[index] for index in y_indexes_per_request[(p, s)]) == model.x[p, s]
+    model.x_and_y = Constraint(model.x_indexes, rule=f1)
+
+    # an operator does at most one service in each time slot
+    def f2(model, o, c, t):
+        return sum(model.y[index] for index in y_indexes_per_operator_time_slot[(o, c, t)]) <= 1
+    model.operator_capacity = Constraint(model.operator_time_slot_indexes, rule=f2)
+
+    # a patient receives at most one service in each time slot
+    def f3(model, p, t):
+        return sum(model.y[index] for index in y_indexes_per_patient_time_slot[(p, t)]) <= 1
+    model.patient_capacity = Constraint(model.patient_time_slot_indexes, rule=f3)
+
+    # interchangeable operators are ordered by their load, as in the big-M model
+    def f4(model, o, oo, c):
+        operator_load = sum(model.y[index] * instance['services'][index[1]]['duration'] for index in y_indexes_per_operator.get((o, c), []))
+        previous_operator_load = sum(model.y[index] * instance['services'][index[1]]['duration'] for index in y_indexes_per_operator.get((oo, c), []))
+        if type(operator_load) is int:
+            return Constraint.Skip
+        return operator_load <= previous_operator_load
+    model.operator_symmetry = Constraint(model.symmetry_indexes, rule=f4)
+
     return model
 
 def get_milp_master_model(instance):
@@ -205,6 +381,17 @@ def get_milp_master_model(instance):
                     if start_day != end_day:
                         window_constraint_indexes.append((patient_name, service_name, start_day, end_day))
 
+    # overlapping windows can produce the same triplet more than once
+    x_indexes = list(set(x_indexes))
+
+    # (patient, service) couples bucketed by (day_index, care_unit_name), one pass over all x_indexes
+    x_indexes_per_day_care_unit = {}
+    for patient_name, service_name, day_index in x_indexes:
+        key = (day_index, instance['services'][service_name]['care_unit'])
+        if key not in x_indexes_per_day_care_unit:
+            x_indexes_per_day_care_unit[key] = []
+        x_indexes_per_day_care_unit[key].append((patient_name, service_name))
+
     # day_care_unit_indexes are of type (day_index, care_unit_name)
     day_care_unit_indexes = []
     day_care_unit_total_capacity = {}
@@ -214,15 +401,9 @@ def get_milp_master_model(instance):
 
             key = (int(day_name), care_unit_name)
 
-            # check if exists at least one patient that requests a service of this care unit
-            exists_at_least_one_x = False
-            for patient_name, service_name, day_index in x_indexes:
-                if day_index == key[0] and instance['services'][service_name]['care_unit'] == care_unit_name:
-                    exists_at_least_one_x = True
-                    break
-
-            # it's useless to generate empty constraints
-            if not exists_at_least_one_x:
+            # it's useless to generate empty constraints: at least one patient
+            # must request a service of this care unit
+            if key not in x_indexes_per_day_care_unit:
                 continue
 
             day_care_unit_indexes.append(key)
@@ -235,7 +416,7 @@ def get_milp_master_model(instance):
 
     model = ConcreteModel()
 
-    model.x_indexes = Set(initialize=list(set(x_indexes)))
+    model.x_indexes = Set(initialize=x_indexes)
     model.window_constraint_indexes = Set(initialize=list(set(window_constraint_indexes)))
     model.day_care_unit_indexes = Set(initialize=day_care_unit_indexes)
 
@@ -261,7 +442,7 @@ def get_milp_master_model(instance):
     model.window_constraints = Constraint(model.window_constraint_indexes, rule=window_constraint_function)
 
     def total_capacity_constraint_function(model, d, c):
-        return sum([model.x[p, s, d] * instance['services'][s]['duration'] for p, s, dd in model.x_indexes if d == dd and instance['services'][s]['care_unit'] == c]) <= day_care_unit_total_capacity[(d, c)]
+        return sum([model.x[p, s, d] * instance['services'][s]['duration'] for p, s in x_indexes_per_day_care_unit[(d, c)]]) <= day_care_unit_total_capacity[(d, c)]
     model.total_capacity_constraint = Constraint(model.day_care_unit_indexes, rule=total_capacity_constraint_function)
 
     model.cores = ConstraintList()
@@ -321,6 +502,23 @@ def get_subproblem_model_solution(model):
 
     return results
 
+def get_time_indexed_subproblem_model_solution(model):
+
+    results = {'scheduled': []}
+
+    solution_values = model.y.extract_values()
+    for (patient_name, service_name, operator_name, care_unit_name, time_slot), solution_value in solution_values.items():
+        if solution_value is not None and solution_value > 0.01:
+            results['scheduled'].append({
+                'patient': patient_name,
+                'service': service_name,
+                'operator': operator_name,
+                'care_unit': care_unit_name,
+                'time': time_slot
+            })
+
+    return results
+
 def extract_solution_from_milp_result(model, result, problem_type):
 
     model.solutions.load_from(result)
@@ -333,9 +531,37 @@ def extract_solution_from_milp_result(model, result, problem_type):
             results = get_master_model_solution(model)
         elif problem_type == 'subproblem':
             results = get_subproblem_model_solution(model)
+        elif problem_type == 'time_indexed_subproblem':
+            results = get_time_indexed_subproblem_model_solution(model)
     
     return results
 
+def set_master_model_start(instance, model, schedule):
+
+    # every x is zero, except the (patient, service, day) scheduled by the heuristic
+    for index in model.x_indexes:
+        model.x[index].value = 0
+
+    value = 0
+    for day_name, daily_schedule in schedule['scheduled'].items():
+        for item in daily_schedule:
+            p, s, d = item['patient'], item['service'], int(day_name)
+            if (p, s, d) not in model.x_indexes:
+                continue
+            model.x[p, s, d].value = 1
+            value += instance['services'][s]['duration'] * instance['patients'][p]['priority']
+
+    model.objective_function_value.value = value
+
+def add_constraint_to_model(opt, constraint_list, expression):
+
+    # the constraint is added to the model and, if persistent, to the solver
+    constraint = constraint_list.add(expression)
+    if isinstance(opt, PersistentSolver) and opt.has_instance():
+        opt.add_constraint(constraint)
+
+    return constraint
+
 def get_milp_model(instance, problem_type):
 
     model = None
@@ -343,203 +569,548 @@ def get_milp_model(instance, problem_type):
     if problem_type == 'master':
         model = get_milp_master_model(instance)
         # add_opt_to_master_model(instance, model)
+    elif problem_type == 'time_indexed_subproblem':
+        model = get_milp_time_indexed_model(instance)
     else:
         model = get_milp_std_model(instance)
         # add_opt_to_subproblem_model(instance, model)
     
     return model
 
-def solve_problem(instance, output_folder_path: Path, time_limit: int):
+def solve_problem(instance, output_folder_path: Path, time_limit: int, log_file_name: str='milp_logfile.log', threads: int=None, tee: bool=True, use_persistent: bool=False, formulation: str='big-m'):
+
+    # the big-M model and the time-indexed one share the same results format
+    problem_type = 'time_indexed_subproblem' if formulation == 'time-indexed' else 'subproblem'
 
     creation_start_time = perf_counter()
-    model = get_milp_model(instance, 'subproblem')
+    model = get_milp_model(instance, problem_type)
     creation_elapsed_time = perf_counter() - creation_start_time
 
-    opt = pyo.SolverFactory('gurobi')
+    opt = get_solver('gurobi', use_persistent)
 
     if time_limit is not None:
         opt.options['TimeLimit'] = time_limit
     opt.options['SoftMemLimit'] = 8
+    if threads is not None:
+        opt.options['Threads'] = threads
     # model.setParam('MIPGap', 0.05)
 
     solving_start_time = perf_counter()
-    result = opt.solve(model, logfile=output_folder_path.joinpath('milp_logfile.log'), tee=True)
+    result = solve_model(opt, model, logfile=str(output_folder_path.joinpath(log_file_name)), tee=tee)
     # result = opt.solve(model, tee=True)
 
     solving_elapsed_time = perf_counter() - solving_start_time
 
-    model.solutions.store_to(result)
-    solution = result.solution[0]
-    lower_bound = float(result['problem'][0]['Lower bound'])
-    upper_bound = float(result['problem'][0]['Upper bound'])
-    gap = float(solution['gap'])
-    if gap <= 1e-5 and lower_bound != upper_bound:
-        gap = (upper_bound - lower_bound) / upper_bound
-    value = float(solution['objective']['objective']['Value'])
-
-    solver_info = {
-        'method': 'milp',
-        'model_creation_time': creation_elapsed_time,
-        'model_solving_time': solving_elapsed_time,
-        'solver_internal_time': float(result.solver.time),
-        'status': str(result.solver.status),
-        'termination_condition': str(result.solver.termination_condition),
-        'lower_bound': lower_bound,
-        'upper_bound': upper_bound if upper_bound <= 1e9 else 'infinity',
-        'gap': gap,
-        'objective_function_value': value
-    }
+    method = 'milp_time_indexed' if formulation == 'time-indexed' else 'milp'
+    solver_info = get_solver_info(model, result, creation_elapsed_time, solving_elapsed_time, method)
 
-    results = extract_solution_from_milp_result(model, result, 'subproblem')
+    results = extract_solution_from_milp_result(model, result, problem_type)
 
     add_rejected_services_to_results(instance, results)
     
     return (results, solver_info)
 
-################################################################################
-#                                   /main.py                                   #
-################################################################################
+def solve_heuristic_problem(instance):
 
-# read the command line arguments
-parser = ArgumentParser(prog='main.py', description='Main script for the instances solving process.')
+    start_time = perf_counter()
 
-parser.add_argument('-i', '--input', type=Path, required=True, help='Master input instance of the problem.')
-parser.add_argument('-o', '--output', type=Path, help='Destination folder for all the output (defaults to an automatic generated name).')
-parser.add_argument('-t', '--time-limit', type=int, default=3600, help='Time limit in seconds for the solving process.')
-parser.add_argument('-v', '--verbose', action='store_true')
-args = parser.parse_args()
+    # longest services first, ties broken by name to get always the same schedule
+    requests = []
+    for patient_name, service_names in instance['requests'].items():
+        for service_name in service_names:
+            requests.append((patient_name, service_name))
+    requests.sort(key=lambda r: (-instance['services'][r[1]]['duration'], r[0], r[1]))
 
-if args.output:
-    solution_folder_path = args.output
-else:
-    solution_folder_path = args.input.parent.joinpath(f'SOL_{args.input.stem}')
+    # busy [start, end) intervals of each (care_unit, operator) and of each patient
+    operator_busy_intervals = {}
+    patient_busy_intervals = {}
 
-solution_folder_path.mkdir(exist_ok=True)
+    def is_free(busy_intervals, start, end):
+        for busy_start, busy_end in busy_intervals:
+            if start < busy_end and busy_start < end:
+                return False
+        return True
 
-if args.verbose:
-    start_time = perf_counter()
+    results = {'scheduled': []}
 
-# load master instance data
-with open(args.input, 'r') as file:
-    instance = load(file)
+    for patient_name, service_name in requests:
 
-# copy instance data to solution folder
-with open(solution_folder_path.joinpath('instance.json'), 'w') as file:
-    dump(instance, file, indent=4)
+        care_unit_name = instance['services'][service_name]['care_unit']
+        duration = instance['services'][service_name]['duration']
+        patient_intervals = patient_busy_intervals.get(patient_name, [])
 
-patient_priorities = {}
-for patient_name, patient_protocols in instance['patients'].items():
-    patient_priorities[patient_name] = patient_protocols['priority']
+        # each request is given to the operator that can start it first
+        best_operator_name = None
+        best_time_slot = None
+        for operator_name, operator in sorted(instance['operators'].get(care_unit_name, {}).items()):
+            operator_intervals = operator_busy_intervals.get((care_unit_name, operator_name), [])
+            for time_slot in range(operator['start'], operator['start'] + operator['duration'] - duration + 1):
+                if best_time_slot is not None and time_slot >= best_time_slot:
+                    break
+                if is_free(operator_intervals, time_slot, time_slot + duration) and is_free(patient_intervals, time_slot, time_slot + duration):
+                    best_operator_name = operator_name
+                    best_time_slot = time_slot
+                    break
 
-# results of all subproblems (last iteration schedule)
-all_subproblem_results = {}
+        if best_operator_name is None:
+            continue
 
-# if method is milp, get the master model only once here
-if args.verbose:
-    creation_start_time = perf_counter()
-    print('start master creation')
+        if (care_unit_name, best_operator_name) not in operator_busy_intervals:
+            operator_busy_intervals[(care_unit_name, best_operator_name)] = []
+        operator_busy_intervals[(care_unit_name, best_operator_name)].append((best_time_slot, best_time_slot + duration))
 
-master_model = get_milp_master_model(instance)
+        if patient_name not in patient_busy_intervals:
+            patient_busy_intervals[patient_name] = []
+        patient_busy_intervals[patient_name].append((best_time_slot, best_time_slot + duration))
 
-if args.verbose:
-    creation_elapsed_time = perf_counter() - creation_start_time
-    print(f'end master creation: {creation_elapsed_time} seconds.')
+        results['scheduled'].append({
+            'patient': patient_name,
+            'service': service_name,
+            'operator': best_operator_name,
+            'care_unit': care_unit_name,
+            'time': best_time_slot
+        })
 
-opt = SolverFactory('gurobi')
-opt.options['TimeLimit'] = args.time_limit
+    add_rejected_services_to_results(instance, results)
 
-if args.verbose:
-    print('Starting master solving')
-    solving_start_time = perf_counter()
+    solving_elapsed_time = perf_counter() - start_time
 
-result = opt.solve(master_model, logfile=solution_folder_path.joinpath('milp_logfile.log'), tee=True)
-# result = opt.solve(model, tee=True)
+    # same objective of the milp subproblem: the total duration of the services done
+    value = sum(instance['services'][r['service']]['duration'] for r in results['scheduled'])
+    upper_bound = sum(instance['services'][s]['duration'] for _, s in requests)
 
-if args.verbose:
-    solving_elapsed_time = perf_counter() - solving_start_time
-    print(f'Ending master problem. Took {solving_elapsed_time}')
-
-master_model.solutions.store_to(result)
-solution = result.solution[0]
-lower_bound = float(result['problem'][0]['Lower bound'])
-upper_bound = float(result['problem'][0]['Upper bound'])
-gap = float(solution['gap'])
-if gap <= 1e-5 and lower_bound != upper_bound:
-    gap = (upper_bound - lower_bound) / upper_bound
-value = float(solution['objective']['objective']['Value'])
-
-solver_info = {
-    'method': 'milp',
-    'model_creation_time': creation_elapsed_time,
-    'model_solving_time': solving_elapsed_time,
-    'solver_internal_time': float(result.solver.time),
-    'status': str(result.solver.status),
-    'termination_condition': str(result.solver.termination_condition),
-    'lower_bound': lower_bound,
-    'upper_bound': upper_bound if upper_bound <= 1e9 else 'infinity',
-    'gap': gap,
-    'objective_function_value': value
-}
-
-master_results = extract_solution_from_milp_result(master_model, result, 'master')
-
-# write master results to file
-with open(solution_folder_path.joinpath(f'master_results.json'), 'w') as file:
-    dump(master_results, file, indent=4)
-with open(solution_folder_path.joinpath(f'master_solver_info.json'), 'w') as file:
-    dump(solver_info, file, indent=4)
-
-all_subproblem_results = {}
-
-# solve the subproblem for each day
-for day_name, day_requests in master_results.items():
-
-    # build the subproblem input for this day
-    subproblem_input = {
-        'operators': instance['days'][day_name],
-        'services': instance['services'],
-        'requests': master_results[day_name],
-        'priorities': patient_priorities
+    # a schedule without rejected requests can't be improved, otherwise the
+    # heuristic proves nothing about the rejected ones
+    solver_info = {
+        'method': 'heuristic',
+        'model_creation_time': 0.0,
+        'model_solving_time': solving_elapsed_time,
+        'solver_internal_time': solving_elapsed_time,
+        'status': 'ok',
+        'termination_condition': 'optimal' if len(results['rejected']) == 0 else 'feasible',
+        'lower_bound': float(value),
+        'upper_bound': float(upper_bound),
+        'gap': (upper_bound - value) / upper_bound if upper_bound > 0 else 0.0,
+        'objective_function_value': float(value)
     }
 
-    if args.verbose:
-        print(f'Starting subproblem for day {day_name}.')
+    return (results, solver_info)
 
-    # solve the subproblem for this day
+def solve_day_subproblem(day_name, subproblem_input, output_folder_path: Path, time_limit: int, threads: int=None, tee: bool=True, use_persistent: bool=False, method: str='milp', formulation: str='big-m'):
+
+    # the heuristic alone, or as a first try when in 'auto' mode
+    if method == 'heuristic' or method == 'auto':
+        subproblem_results, solver_info = solve_heuristic_problem(subproblem_input)
+        if method == 'heuristic' or len(subproblem_results['rejected']) == 0:
+            return (day_name, subproblem_results, solver_info)
+
+    # every day writes its own solver log, so that parallel solves don't clash
     subproblem_results, solver_info = solve_problem(
         instance=subproblem_input,
-        output_folder_path=solution_folder_path,
-        time_limit=str(args.time_limit)
+        output_folder_path=output_folder_path,
+        time_limit=time_limit,
+        log_file_name=f'day{day_name}_milp_logfile.log',
+        threads=threads,
+        tee=tee,
+        use_persistent=use_persistent,
+        formulation=formulation
     )
 
+    return (day_name, subproblem_results, solver_info)
+
+def get_subproblem_input_key(subproblem_input, method, formulation, time_limit, use_persistent):
+
+    # only the data and the solver settings that can change the subproblem
+    # solution are hashed, in a canonical form: sorted keys and sorted requests
+    # of each patient
+    canonical_input = {
+        'method': method,
+        'formulation': formulation,
+        'time_limit': str(time_limit),
+        'persistent': use_persistent,
+        'operators': subproblem_input['operators'],
+        'services': subproblem_input['services'],
+        'requests': {p: sorted(s) for p, s in subproblem_input['requests'].items()},
+        'priorities': {p: subproblem_input['priorities'][p] for p in subproblem_input['requests'].keys()}
+    }
+
+    return sha256(dumps(canonical_input, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def get_cached_subproblem_solution(cache, cache_folder_path, key):
+
+    # memory first, then the optional disk cache
+    if key in cache:
+        return cache[key]
+
+    if cache_folder_path is not None:
+        cache_file_path = cache_folder_path.joinpath(f'{key}.json')
+        if cache_file_path.exists():
+            cached_solution = read_json(cache_file_path)
+            cache[key] = (cached_solution['results'], cached_solution['solver_info'])
+            return cache[key]
+
+    return None
+
+def set_cached_subproblem_solution(cache, cache_folder_path, key, subproblem_results, solver_info):
+
+    cache[key] = (subproblem_results, solver_info)
+
+    # only optimal solutions are kept between runs: time limited ones could be
+    # improved by a later run
+    if cache_folder_path is not None and solver_info['termination_condition'] == 'optimal':
+        write_json(cache_folder_path.joinpath(f'{key}.json'), {'results': subproblem_results, 'solver_info': solver_info}, compact=True)
+
+def compute_cores(instance, master_results, all_subproblem_results, subproblem_solver_infos):
+
+    cores = []
+
+    for day_name, subproblem_results in all_subproblem_results.items():
+
+        # a day with all requests satisfied gives no information
+        if len(subproblem_results['rejected']) == 0:
+            continue
+
+        # only an optimal subproblem proves that its requests can't be all
+        # satisfied toghether in that day
+        if subproblem_solver_infos[day_name]['termination_condition'] != 'optimal':
+            continue
+
+        day = instance['days'][day_name]
+
+        rejected_requests = set()
+        for patient_name, service_names in subproblem_results['rejected'].items():
+            for service_name in service_names:
+                rejected_requests.add((patient_name, service_name))
+
+        # requests grouped by patient and by care unit
+        requests_per_patient = {}
+        requests_per_care_unit = {}
+        for patient_name, service_names in master_results[day_name].items():
+            for service_name in service_names:
+
+                # a request that no operator of the day can satisfy is a core by itself
+                care_unit_name = instance['services'][service_name]['care_unit']
+                duration = instance['services'][service_name]['duration']
+                if all(operator['duration'] < duration for operator in day.get(care_unit_name, {}).values()):
+                    cores.append({'days': [day_name], 'components': [(patient_name, service_name)]})
+                    rejected_requests.discard((patient_name, service_name))
+                    continue
+
+                if patient_name not in requests_per_patient:
+                    requests_per_patient[patient_name] = []
+                requests_per_patient[patient_name].append((patient_name, service_name))
+
+                if care_unit_name not in requests_per_care_unit:
+                    requests_per_care_unit[care_unit_name] = []
+                requests_per_care_unit[care_unit_name].append((patient_name, service_name))
+
+        # requests that share neither a patient nor a care unit don't interact in
+        # the subproblem: the optimal schedule satisfies every group of linked
+        # requests that is feasible, so each group with a rejection is a core
+        visited_requests = set()
+        for rejected_request in sorted(rejected_requests):
+
+            if rejected_request in visited_requests:
+                continue
+
+            components = []
+            requests_to_visit = [rejected_request]
+            visited_requests.add(rejected_request)
+            while len(requests_to_visit) > 0:
+                patient_name, service_name = requests_to_visit.pop()
+                components.append((patient_name, service_name))
+
+                care_unit_name = instance['services'][service_name]['care_unit']
+                for linked_request in requests_per_patient[patient_name] + requests_per_care_unit[care_unit_name]:
+                    if linked_request not in visited_requests:
+                        visited_requests.add(linked_request)
+                        requests_to_visit.append(linked_request)
+
+            cores.append({'days': [day_name], 'components': sorted(components)})
+
+    return cores
+
+def expand_core_days(instance, cores):
+
+    # days with the same operators are interchangeable: what is infeasible in
+    # one of them is infeasible in all of them
+    for core in cores:
+        day = instance['days'][core['days'][0]]
+        core['days'] = [day_name for day_name, other_day in instance['days'].items() if other_day == day]
+
+def add_cores_to_master_model(opt, master_model, cores, added_cores):
+
+    added_core_number = 0
+
+    for core in cores:
+        for day_name in core['days']:
+
+            day_index = int(day_name)
+
+            # skip cores already present (from previous iterations or days)
+            key = (day_index, frozenset(core['components']))
+            if key in added_cores:
+                continue
+            added_cores.add(key)
+
+            # if a request can't be done that day, the core is already satisfied
+            if any((p, s, day_index) not in master_model.x_indexes for p, s in core['components']):
+                continue
+
+            # no-good cut: not all the core requests can be done in that day
+            add_constraint_to_model(opt, master_model.cores, sum(master_model.x[p, s, day_index] for p, s in core['components']) <= len(core['components']) - 1)
+            added_core_number += 1
+
+    return added_core_number
+
+################################################################################
+#                                   /main.py                                   #
+################################################################################
+
+if __name__ == '__main__':
+
+    # read the command line arguments
+    parser = ArgumentParser(prog='main.py', description='Main script for the instances solving process.')
+
+    parser.add_argument('-i', '--input', type=Path, required=True, help='Master input instance of the problem.')
+    parser.add_argument('-o', '--output', type=Path, help='Destination folder for all the output (defaults to an automatic generated name).')
+    parser.add_argument('-t', '--time-limit', type=int, default=3600, help='Time limit in seconds for the solving process.')
+    parser.add_argument('-m', '--max-iterations', type=int, help='Maximum number of master and subproblem iterations (10 by default, 1 with the heuristic subproblem method).')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of processes used to solve the daily subproblems in parallel.')
+    parser.add_argument('-p', '--persistent', action='store_true', help='Use the persistent solver interface, if gurobipy is available.')
+    parser.add_argument('-s', '--subproblem-method', type=str, default='milp', choices=['heuristic', 'milp', 'auto'], help='How daily subproblems are solved (\'auto\' runs the milp only if the heuristic rejects some request).')
+    parser.add_argument('-f', '--formulation', type=str, default='big-m', choices=['big-m', 'time-indexed'], help='Milp formulation of the daily subproblems.')
+    parser.add_argument('-c', '--cache-folder', type=Path, help='Folder where subproblem solutions are cached between runs (by default they are cached in memory only).')
+    parser.add_argument('--warm-start', action='store_true', help='Start the first master solve from a greedy schedule.')
+    parser.add_argument('--compact', action='store_true', help='Write output JSON files without indentation.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    # the heuristic can't prove that a rejected request is infeasible, so it
+    # never gives cores to refine the master with
+    if args.subproblem_method == 'heuristic':
+        if args.max_iterations is not None and args.max_iterations > 1:
+            parser.error('the heuristic subproblem method finds no cores, use \'auto\' or \'milp\' to iterate more than once')
+        args.max_iterations = 1
+    elif args.max_iterations is None:
+        args.max_iterations = 10
+
+    if args.output:
+        solution_folder_path = args.output
+    else:
+        solution_folder_path = args.input.parent.joinpath(f'SOL_{args.input.stem}')
+
+    solution_folder_path.mkdir(exist_ok=True)
+
+    if args.verbose:
+        start_time = perf_counter()
+
+    # load master instance data
+    instance = read_json(args.input)
+
+    # copy instance data to solution folder
+    write_json(solution_folder_path.joinpath('instance.json'), instance, args.compact)
+
+    # days stored as templates are written in full only in memory
+    instance = get_expanded_instance(instance)
+
+    patient_priorities = {}
+    for patient_name, patient_protocols in instance['patients'].items():
+        patient_priorities[patient_name] = patient_protocols['priority']
+
+    # results of all subproblems (last iteration schedule)
+    all_subproblem_results = {}
+
+    # if method is milp, get the master model only once here
+    if args.verbose:
+        print('start master creation')
+
+    creation_start_time = perf_counter()
+    master_model = get_milp_master_model(instance)
+    creation_elapsed_time = perf_counter() - creation_start_time
+
     if args.verbose:
-        print(f'Ending subproblem for day {day_name}.')
+        print(f'end master creation: {creation_elapsed_time} seconds.')
+
+    opt = get_solver('gurobi', args.persistent)
+    opt.options['TimeLimit'] = args.time_limit
+
+    if args.verbose and args.persistent and not isinstance(opt, PersistentSolver):
+        print('Persistent solver interface not available, using the default one')
+
+    # the greedy schedule is a feasible starting point only for the first
+    # master, later ones are warm started by the solver itself (if persistent)
+    use_warm_start = args.warm_start and opt.warm_start_capable()
+    if use_warm_start:
+        set_master_model_start(instance, master_model, get_greedy_schedule(instance))
+
+    # (day_index, core components) of every cut added to the master
+    added_cores = set()
+
+    # solutions of already seen subproblems, indexed by the hash of their input
+    subproblem_cache = {}
+    if args.cache_folder is not None:
+        args.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    iteration_index = 0
+    while True:
+
+        if args.verbose:
+            print(f'Starting master solving (iteration {iteration_index})')
 
-    # put toghether all day results in a single object, indexed by day name
-    all_subproblem_results[day_name] = subproblem_results
+        solving_start_time = perf_counter()
+        # starting values of the variables are passed only to the first solve
+        solve_options = {'warmstart': True} if use_warm_start and iteration_index == 0 else {}
+        result = solve_model(opt, master_model, logfile=str(solution_folder_path.joinpath('milp_logfile.log')), tee=True, **solve_options)
+        # result = opt.solve(model, tee=True)
+        solving_elapsed_time = perf_counter() - solving_start_time
 
-    # check if exists at least one request not satisfied
-    if len(subproblem_results['rejected']) > 0:
         if args.verbose:
-            print(f'Day {day_name} is not completely satisfied.')
+            print(f'Ending master problem. Took {solving_elapsed_time}')
+
+        solver_info = get_solver_info(master_model, result, creation_elapsed_time, solving_elapsed_time)
+
+        master_results = extract_solution_from_milp_result(master_model, result, 'master')
+
+        # write master results to file
+        write_json(solution_folder_path.joinpath(f'master_results.json'), master_results, args.compact)
+        write_json(solution_folder_path.joinpath(f'master_solver_info.json'), solver_info, args.compact)
+
+        all_subproblem_results = {}
+        subproblem_solver_infos = {}
+
+        # build the subproblem input for each day
+        subproblem_inputs = {}
+        for day_name, day_requests in master_results.items():
+            subproblem_inputs[day_name] = {
+                'operators': instance['days'][day_name],
+                'services': instance['services'],
+                'requests': master_results[day_name],
+                'priorities': patient_priorities
+            }
+
+        # identical subproblems (from this or previous iterations) are solved only once
+        subproblem_keys = {}
+        unsolved_subproblem_inputs = {}
+        unsolved_subproblem_keys = set()
+        for day_name, subproblem_input in subproblem_inputs.items():
+            key = get_subproblem_input_key(subproblem_input, args.subproblem_method, args.formulation, args.time_limit, args.persistent)
+            subproblem_keys[day_name] = key
+            if key in unsolved_subproblem_keys:
+                continue
+            if get_cached_subproblem_solution(subproblem_cache, args.cache_folder, key) is None:
+                unsolved_subproblem_inputs[day_name] = subproblem_input
+                unsolved_subproblem_keys.add(key)
+
+        if args.verbose and len(unsolved_subproblem_inputs) < len(subproblem_inputs):
+            print(f'Reusing cached solutions for {len(subproblem_inputs) - len(unsolved_subproblem_inputs)} days.')
+
+        # solve the subproblem for each day, one at a time or in a process pool
+        if args.workers > 1 and len(unsolved_subproblem_inputs) > 1:
+
+            # split the available cores between the solver instances
+            threads = max(1, (cpu_count() or 1) // args.workers)
+
+            if args.verbose:
+                print(f'Starting subproblems of {len(unsolved_subproblem_inputs)} days with {args.workers} workers.')
+
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                day_results = list(executor.map(
+                    solve_day_subproblem,
+                    unsolved_subproblem_inputs.keys(),
+                    unsolved_subproblem_inputs.values(),
+                    repeat(solution_folder_path),
+                    repeat(str(args.time_limit)),
+                    repeat(threads),
+                    repeat(False),
+                    repeat(args.persistent),
+                    repeat(args.subproblem_method),
+                    repeat(args.formulation)
+                ))
+
+        else:
+
+            day_results = []
+            for day_name, subproblem_input in unsolved_subproblem_inputs.items():
+
+                if args.verbose:
+                    print(f'Starting subproblem for day {day_name}.')
+
+                # solve the subproblem for this day
+                day_results.append(solve_day_subproblem(
+                    day_name=day_name,
+                    subproblem_input=subproblem_input,
+                    output_folder_path=solution_folder_path,
+                    time_limit=str(args.time_limit),
+                    use_persistent=args.persistent,
+                    method=args.subproblem_method,
+                    formulation=args.formulation
+                ))
+
+                if args.verbose:
+                    print(f'Ending subproblem for day {day_name}.')
+
+        for day_name, subproblem_results, solver_info in day_results:
+            set_cached_subproblem_solution(subproblem_cache, args.cache_folder, subproblem_keys[day_name], subproblem_results, solver_info)
+
+        # results are merged in day order, whatever the solving order was
+        for day_name in subproblem_inputs.keys():
+            subproblem_results, solver_info = subproblem_cache[subproblem_keys[day_name]]
+
+            # put toghether all day results in a single object, indexed by day name
+            all_subproblem_results[day_name] = subproblem_results
+            subproblem_solver_infos[day_name] = solver_info
+
+            # check if exists at least one request not satisfied
+            if len(subproblem_results['rejected']) > 0:
+                if args.verbose:
+                    print(f'Day {day_name} is not completely satisfied.')
     
-    # write the subproblem data to file
-    with open(solution_folder_path.joinpath(f'day{day_name}_subproblem_input.json'), 'w') as file:
-        dump(subproblem_input, file, indent=4)
-    with open(solution_folder_path.joinpath(f'day{day_name}_subproblem_results.json'), 'w') as file:
-        dump(subproblem_results, file, indent=4)
-    with open(solution_folder_path.joinpath(f'day{day_name}_subproblem_solver_info.json'), 'w') as file:
-        dump(solver_info, file, indent=4)
-
-# write aggregate subproblem results to file
-with open(solution_folder_path.joinpath(f'master_results.json'), 'w') as file:
-    dump(master_results, file, indent=4)
-with open(solution_folder_path.joinpath(f'all_subproblem_results.json'), 'w') as file:
-    dump(all_subproblem_results, file, indent=4)
-
-# write last iteration schedule results to file
-with open(solution_folder_path.joinpath('all_subproblem_results.json'), 'w') as file:
-    dump(all_subproblem_results, file, indent=4)
-
-if args.verbose:
-    print(f'Total time taken: {perf_counter() - start_time} seconds.')
\ No newline at end of file
+            # write the subproblem data to file
+            write_json(solution_folder_path.joinpath(f'day{day_name}_subproblem_input.json'), subproblem_inputs[day_name], args.compact)
+            write_json(solution_folder_path.joinpath(f'day{day_name}_subproblem_results.json'), subproblem_results, args.compact)
+            write_json(solution_folder_path.joinpath(f'day{day_name}_subproblem_solver_info.json'), solver_info, args.compact)
+
+        # derive the cores from the rejected requests of each day
+        cores = compute_cores(instance, master_results, all_subproblem_results, subproblem_solver_infos)
+        expand_core_days(instance, cores)
+
+        # days with rejected requests that are not proven infeasible (heuristic
+        # or time limited solutions) can't give cores
+        unproven_day_names = [day_name for day_name, subproblem_results in all_subproblem_results.items()
+            if len(subproblem_results['rejected']) > 0 and subproblem_solver_infos[day_name]['termination_condition'] != 'optimal']
+        if len(unproven_day_names) > 0:
+            print(f'{len(unproven_day_names)} days have rejected requests not proven infeasible at iteration {iteration_index}: {", ".join(unproven_day_names)}.')
+
+        # every subproblem is fully satisfied (or no core can be proven)
+        if len(cores) == 0:
+            if args.verbose and len(unproven_day_names) == 0:
+                print(f'No new cores found at iteration {iteration_index}.')
+            break
+
+        write_json(solution_folder_path.joinpath(f'{args.input.stem}_iter_{iteration_index}_cores.json'), [{
+            'days': core['days'],
+            'components': [{'patient': p, 'service': s} for p, s in core['components']]
+        } for core in cores], args.compact)
+
+        if iteration_index + 1 >= args.max_iterations:
+            if args.verbose:
+                print(f'Iteration limit of {args.max_iterations} reached.')
+            break
+
+        # add the cores to the master as no-good cuts and solve it again
+        added_core_number = add_cores_to_master_model(opt, master_model, cores, added_cores)
+
+        if args.verbose:
+            print(f'Added {added_core_number} cores to the master at iteration {iteration_index}.')
+
+        if added_core_number == 0:
+            break
+
+        iteration_index += 1
+
+    # write last iteration schedule results to file
+    write_json(solution_folder_path.joinpath('all_subproblem_results.json'), all_subproblem_results, args.compact)
+
+    if args.verbose:
+        print(f'Total time taken: {perf_counter() - start_time} seconds.')
@@ -1,96 +1,156 @@
 import argparse
 from pathlib import Path
-import json
+import sys
 from time import perf_counter
-import pyomo.environ as pyo
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from os import cpu_count
 
-from tools import get_monolitic_model, get_results_from_monolitic_model
+from tools import get_monolitic_model, get_results_from_monolitic_model, get_solver, solve_model, get_solver_info
+from tools import get_greedy_schedule, set_monolitic_model_start
 
-parser = argparse.ArgumentParser(prog='monolitic.py', description='Solve monolitic model')
-parser.add_argument('-i', '--input', type=Path, help='Folder with the instances', required=True)
-parser.add_argument('--inefficient-operators', action='store_true', help='Use inefficient operator constraints')
-parser.add_argument('-s', '--solver', type=str, default='gurobi', choices=['gurobi', 'glpk'], help='The solver used')
-parser.add_argument('-t', '--time-limit', type=int, help='Optional solver time limit')
-parser.add_argument('-v', '--verbose', action='store_true')
-args = parser.parse_args()
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from json_tools import read_json, write_json, get_expanded_instance
 
-input_folder_path = Path(args.input).resolve()
-use_inefficient_operators = bool(args.inefficient_operators)
-solver = str(args.solver)
-time_limit = args.time_limit
-verbose = bool(args.verbose)
 
-for instance_path in input_folder_path.iterdir():
-
-    # the only valid files are JSON that don't start with 'SOL_'
-    if not instance_path.is_file() or instance_path.is_dir():
-        continue
-
-    if instance_path.suffix != '.json':
-        continue
-
-    if str(instance_path.name).startswith('SOL_'):
-        continue
-
-    if instance_path.name == 'info.json':
-        continue
+def solve_instance(instance_path: Path, use_inefficient_operators: bool, solver: str, time_limit: int, threads: int, verbose: bool, use_persistent: bool = False, use_warm_start: bool = False, formulation: str = 'big-m', compact: bool = False) -> Path:
 
     # read instance file
-    with open(instance_path, 'r') as file:
-        instance = json.load(file)
+    instance = get_expanded_instance(read_json(instance_path))
 
     if verbose:
         print(f'Start model creation of instance {instance_path}')
     creation_start_time = perf_counter()
-    model = get_monolitic_model(instance, use_inefficient_operators)
+    model = get_monolitic_model(instance, use_inefficient_operators, formulation == 'time-indexed')
     creation_elapsed_time = perf_counter() - creation_start_time
     if verbose:
         print(f'End model creation of instance {instance_path}. Took {creation_elapsed_time} seconds.')
 
-    opt = pyo.SolverFactory(solver)
+    opt = get_solver(solver, use_persistent)
 
     if time_limit is not None:
         opt.options['TimeLimit'] = time_limit
     opt.options['SoftMemLimit'] = 8
+    if threads is not None:
+        opt.options['Threads'] = threads
+
+    # a greedy schedule is given to the solver as a (partial) starting solution
+    solve_options = {}
+    if use_warm_start and opt.warm_start_capable():
+        set_monolitic_model_start(instance, model, get_greedy_schedule(instance))
+        solve_options['warmstart'] = True
 
     if verbose:
         print(f'Start solving process of instance {instance_path}')
     solving_start_time = perf_counter()
-    
+
     if verbose:
-        model_results = opt.solve(model, tee=True, logfile=f'{str(instance_path).removesuffix(".json")}.log')
+        model_results = solve_model(opt, model, tee=True, logfile=f'{str(instance_path).removesuffix(".json")}.log', **solve_options)
     else:
-        model_results = opt.solve(model)
-    
+        model_results = solve_model(opt, model, **solve_options)
+
     solving_elapsed_time = perf_counter() - solving_start_time
     if verbose:
         print(f'End solving process of instance {instance_path}. Took {solving_elapsed_time} seconds.')
 
-    model.solutions.store_to(model_results)
-    solution = model_results.solution[0]
-    lower_bound = float(model_results['problem'][0]['Lower bound'])
-    upper_bound = float(model_results['problem'][0]['Upper bound'])
-    gap = float(solution['gap'])
-    if gap <= 1e-5 and lower_bound != upper_bound:
-        gap = (upper_bound - lower_bound) / upper_bound
-    value = float(solution['objective']['total_satisfied_service_durations_scaled_by_priority']['Value'])
-
-    results = {'info': {
-        'method': 'milp_monolitic',
-        'model_creation_time': creation_elapsed_time,
-        'model_solving_time': solving_elapsed_time,
-        'solver_internal_time': float(model_results.solver.time),
-        'status': str(model_results.solver.status),
-        'termination_condition': str(model_results.solver.termination_condition),
-        'lower_bound': lower_bound,
-        'upper_bound': upper_bound if upper_bound <= 1e9 else 'infinity',
-        'gap': gap,
-        'objective_function_value': value
-    }}
-    
+    method = 'milp_monolitic' if formulation != 'time-indexed' else 'milp_monolitic_time_indexed'
+    results = {'info': get_solver_info(model, model_results, creation_elapsed_time, solving_elapsed_time, method)}
+
     results.update(get_results_from_monolitic_model(model))
 
-    # write results to file
+    # write results to a temporary file first, so that an interrupted run
+    # never leaves behind a partial 'SOL_' file
     result_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}')
-    with open(result_path, 'w') as f:
-        json.dump(results, f, indent=4)
\ No newline at end of file
+    temporary_result_path = instance_path.parent.joinpath(f'SOL_{instance_path.name}.tmp')
+    write_json(temporary_result_path, results, compact)
+    temporary_result_path.replace(result_path)
+
+    return result_path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='monolitic.py', description='Solve monolitic model')
+    parser.add_argument('-i', '--input', type=Path, help='Folder with the instances', required=True)
+    parser.add_argument('--inefficient-operators', action='store_true', help='Use inefficient operator constraints')
+    parser.add_argument('-f', '--formulation', type=str, default='big-m', choices=['big-m', 'time-indexed'], help='Model formulation (inefficient operators are used only with big-m)')
+    parser.add_argument('-s', '--solver', type=str, default='gurobi', choices=['gurobi', 'glpk'], help='The solver used')
+    parser.add_argument('-t', '--time-limit', type=int, help='Optional solver time limit')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of instances solved in parallel')
+    parser.add_argument('--threads', type=int, help='Solver threads for each instance (defaults to an equal share of the cores if jobs > 1)')
+    parser.add_argument('-r', '--resume', action='store_true', help='Skip instances that already have a SOL_ results file')
+    parser.add_argument('-p', '--persistent', action='store_true', help='Use the persistent solver interface, if available')
+    parser.add_argument('--warm-start', action='store_true', help='Start the solver from a greedy schedule')
+    parser.add_argument('--compact', action='store_true', help='Write results without indentation')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    input_folder_path = Path(args.input).resolve()
+    use_inefficient_operators = bool(args.inefficient_operators)
+    solver = str(args.solver)
+    time_limit = args.time_limit
+    jobs = max(1, int(args.jobs))
+    resume = bool(args.resume)
+    use_persistent = bool(args.persistent)
+    use_warm_start = bool(args.warm_start)
+    formulation = str(args.formulation)
+    compact = bool(args.compact)
+    verbose = bool(args.verbose)
+
+    threads = args.threads
+    if threads is None and jobs > 1:
+        threads = max(1, (cpu_count() or 1) // jobs)
+
+    # thread limits are only understood by gurobi
+    if solver != 'gurobi':
+        threads = None
+
+    instance_paths = []
+    for instance_path in sorted(input_folder_path.iterdir()):
+
+        # the only valid files are JSON that don't start with 'SOL_'
+        if not instance_path.is_file() or instance_path.is_dir():
+            continue
+
+        if instance_path.suffix != '.json':
+            continue
+
+        if str(instance_path.name).startswith('SOL_'):
+            continue
+
+        if instance_path.name == 'info.json':
+            continue
+
+        # already solved instances are skipped if resuming
+        if resume and instance_path.parent.joinpath(f'SOL_{instance_path.name}').exists():
+            if verbose:
+                print(f'Skipping already solved instance {instance_path}')
+            continue
+
+        instance_paths.append(instance_path)
+
+    if jobs > 1:
+
+        if verbose:
+            print(f'Solving {len(instance_paths)} instances with {jobs} jobs')
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for result_path in executor.map(
+                    solve_instance,
+                    instance_paths,
+                    repeat(use_inefficient_operators),
+                    repeat(solver),
+                    repeat(time_limit),
+                    repeat(threads),
+                    repeat(verbose),
+                    repeat(use_persistent),
+                    repeat(use_warm_start),
+                    repeat(formulation),
+                    repeat(compact)):
+                if verbose:
+                    print(f'Written results {result_path}')
+
+    else:
+        for instance_path in instance_paths:
+            solve_instance(instance_path, use_inefficient_operators, solver, time_limit, threads, verbose, use_persistent, use_warm_start, formulation, compact)
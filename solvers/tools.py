@@ -1,4 +1,5 @@
 import pyomo.environ as pyo
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
 
 
 def clamp(start: int, end: int, start_bound: int, end_bound: int) -> tuple[int, int]:
@@ -22,7 +23,355 @@ def clamp(start: int, end: int, start_bound: int, end_bound: int) -> tuple[int,
     return (start, end)
 
 
-def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteModel:
+def get_solver(solver_name: str, use_persistent: bool = False):
+    """
+    This function returns the solver interface for 'solver_name'. If
+    'use_persistent' is set and a persistent interface exists and is
+    available (e.g. gurobipy is installed), that one is returned: the model is
+    kept in memory by the solver without writing LP files or starting a new
+    process. Otherwise the default shell interface is returned.
+    """
+
+    persistent_solver_names = {
+        'gurobi': 'gurobi_persistent'
+    }
+
+    if use_persistent and solver_name in persistent_solver_names:
+        opt = pyo.SolverFactory(persistent_solver_names[solver_name])
+        if opt.available(exception_flag=False):
+            return opt
+
+    return pyo.SolverFactory(solver_name)
+
+
+def solve_model(opt, model: pyo.ConcreteModel, **kwargs):
+    """
+    This function solves 'model' with any solver interface returned by
+    'get_solver'. Persistent solvers receive the model on their first solve.
+    """
+
+    if isinstance(opt, PersistentSolver):
+        if not opt.has_instance():
+            opt.set_instance(model)
+        return opt.solve(**kwargs)
+
+    return opt.solve(model, **kwargs)
+
+
+def get_solver_internal_time(results, default_time: float) -> float:
+    """
+    This function returns the solving time reported by the solver. Each
+    solver interface stores it under a different name; if none is found then
+    'default_time' is returned.
+    """
+
+    for attribute_name in ['time', 'wall_time', 'wallclock_time']:
+        internal_time = getattr(results.solver, attribute_name, None)
+        if type(internal_time) is int or type(internal_time) is float:
+            return float(internal_time)
+
+    return default_time
+
+
+def get_solver_info(model: pyo.ConcreteModel, results, creation_elapsed_time: float, solving_elapsed_time: float, method: str = 'milp'):
+    """
+    This function returns the solving statistics of 'model' as they are
+    written in the results files. The value is taken from the only active
+    objective of the model.
+    """
+
+    model.solutions.store_to(results)
+    solution = results.solution[0]
+    lower_bound = float(results['problem'][0]['Lower bound'])
+    upper_bound = float(results['problem'][0]['Upper bound'])
+
+    # the persistent interface may not report a gap, it's computed from the bounds
+    gap = solution['gap']
+    gap = float(gap) if gap is not None else 0.0
+    if gap <= 1e-5 and lower_bound != upper_bound:
+        gap = (upper_bound - lower_bound) / upper_bound
+
+    objective_name = next(model.component_objects(pyo.Objective, active=True)).name
+    value = float(solution['objective'][objective_name]['Value'])
+
+    return {
+        'method': method,
+        'model_creation_time': creation_elapsed_time,
+        'model_solving_time': solving_elapsed_time,
+        'solver_internal_time': get_solver_internal_time(results, solving_elapsed_time),
+        'status': str(results.solver.status),
+        'termination_condition': str(results.solver.termination_condition),
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound if upper_bound <= 1e9 else 'infinity',
+        'gap': gap,
+        'objective_function_value': value
+    }
+
+
+def get_operator_equivalence_classes(care_unit) -> list[list[str]]:
+    """
+    This function groups the operators of a care unit that are
+    interchangeable, having the same start and duration. Only groups of at
+    least two operators are returned, each one sorted by operator name.
+    """
+
+    operators_per_interval = {}
+    for operator_name, operator in care_unit.items():
+        key = (operator['start'], operator['duration'])
+        if key not in operators_per_interval:
+            operators_per_interval[key] = []
+        operators_per_interval[key].append(operator_name)
+
+    return sorted([sorted(operator_names) for operator_names in operators_per_interval.values() if len(operator_names) > 1])
+
+
+def get_request_windows(instance, max_day_number: int) -> set[tuple[str, str, int, int]]:
+    """
+    This function unravels each protocol service of the instance and returns
+    the set of quadruples (patient, service, start, end), one for each request
+    window. Windows are clamped to [0, max_day_number] and the ones completely
+    outside are discarded.
+    """
+
+    windows = set()
+
+    for patient_name, patient in instance['patients'].items():
+        for protocol_name, protocol in patient['protocols'].items():
+            for protocol_service in protocol['protocol_services']:
+
+                day = protocol_service['start'] + protocol['initial_shift']
+                service_name = protocol_service['service']
+                tolerance = protocol_service['tolerance']
+                frequency = protocol_service['frequency']
+
+                # generate times interval
+                for time in range(protocol_service['times']):
+
+                    window_start, window_end = clamp(day - tolerance, day + tolerance, 0, max_day_number)
+                    
+                    if window_start is not None and window_end is not None:
+                        windows.add((patient_name, service_name, window_start, window_end))
+                    
+                    day += frequency
+
+    return windows
+
+
+def get_greedy_schedule(instance):
+    """
+    This function builds a feasible schedule of a master instance with a fast
+    constructive heuristic, to be used as a starting solution by the solvers.
+    Request windows are considered by decreasing priority * duration and each
+    one is assigned to the first day and operator that has a free time slot
+    interval for both the operator and the patient. Days inside more windows
+    of the same request are tried first, so that one assignment satisfies all
+    of them. A day is never used if it falls in the span of two overlapping
+    windows of the request that already contains a scheduled day: the models
+    penalize (or forbid) a request done twice in such a span.
+    The returned object has the same format of the final results.
+    """
+
+    max_day_number = max([int(d) for d in instance['days'].keys()])
+    windows = get_request_windows(instance, max_day_number)
+
+    def get_priority(patient_name):
+        return instance['patients'][patient_name].get('priority', 1)
+
+    # most valuable windows first, ties broken in a deterministic way
+    sorted_windows = sorted(windows, key=lambda w: (
+        -get_priority(w[0]) * instance['services'][w[1]]['duration'], w[2], w[3], w[0], w[1]))
+
+    # window bounds of each request
+    windows_per_request = {}
+    for patient_name, service_name, window_start, window_end in windows:
+        if (patient_name, service_name) not in windows_per_request:
+            windows_per_request[(patient_name, service_name)] = []
+        windows_per_request[(patient_name, service_name)].append((window_start, window_end))
+
+    # [start, end] spans of each couple of overlapping windows of a request, the
+    # same ones of the 'window_overlap' variables of the monolitic model
+    overlap_spans_per_request = {}
+    for request, request_windows in windows_per_request.items():
+        overlap_spans_per_request[request] = []
+        for window_start_1, window_end_1 in request_windows:
+            for window_start_2, window_end_2 in request_windows:
+                if (window_start_1, window_end_1) < (window_start_2, window_end_2) and window_end_1 >= window_start_2:
+                    overlap_spans_per_request[request].append((window_start_1, max(window_end_1, window_end_2)))
+
+    # days in which each request is already scheduled
+    scheduled_days_per_request = {}
+
+    # busy [start, end) intervals of operators (day, care_unit, operator) and patients (day, patient)
+    operator_busy_intervals = {}
+    patient_busy_intervals = {}
+
+    def is_free(busy_intervals, start, end):
+        for busy_start, busy_end in busy_intervals:
+            if start < busy_end and busy_start < end:
+                return False
+        return True
+
+    scheduled = {}
+
+    for patient_name, service_name, window_start, window_end in sorted_windows:
+
+        request = (patient_name, service_name)
+        scheduled_days = scheduled_days_per_request.get(request, [])
+
+        # the window could already be satisfied by an overlapping one
+        if any(day >= window_start and day <= window_end for day in scheduled_days):
+            continue
+
+        care_unit_name = instance['services'][service_name]['care_unit']
+        duration = instance['services'][service_name]['duration']
+
+        # days shared with other windows of the request first
+        days = sorted(range(window_start, window_end + 1), key=lambda d: (
+            -sum(1 for ws, we in windows_per_request[request] if d >= ws and d <= we), d))
+
+        assignment = None
+        for day in days:
+
+            # no other scheduled day in the span of overlapping windows with this day
+            if any(day >= ss and day <= se and any(d >= ss and d <= se for d in scheduled_days)
+                   for ss, se in overlap_spans_per_request[request]):
+                continue
+
+            patient_intervals = patient_busy_intervals.get((day, patient_name), [])
+
+            for operator_name, operator in sorted(instance['days'][str(day)].get(care_unit_name, {}).items()):
+                operator_intervals = operator_busy_intervals.get((day, care_unit_name, operator_name), [])
+
+                # earliest time slot free for both the operator and the patient
+                for time_slot in range(operator['start'], operator['start'] + operator['duration'] - duration + 1):
+                    if is_free(operator_intervals, time_slot, time_slot + duration) and is_free(patient_intervals, time_slot, time_slot + duration):
+                        assignment = (day, operator_name, time_slot)
+                        break
+
+                if assignment is not None:
+                    break
+            if assignment is not None:
+                break
+
+        if assignment is None:
+            continue
+
+        day, operator_name, time_slot = assignment
+
+        if request not in scheduled_days_per_request:
+            scheduled_days_per_request[request] = []
+        scheduled_days_per_request[request].append(day)
+
+        if (day, care_unit_name, operator_name) not in operator_busy_intervals:
+            operator_busy_intervals[(day, care_unit_name, operator_name)] = []
+        operator_busy_intervals[(day, care_unit_name, operator_name)].append((time_slot, time_slot + duration))
+
+        if (day, patient_name) not in patient_busy_intervals:
+            patient_busy_intervals[(day, patient_name)] = []
+        patient_busy_intervals[(day, patient_name)].append((time_slot, time_slot + duration))
+
+        if str(day) not in scheduled:
+            scheduled[str(day)] = []
+        scheduled[str(day)].append({
+            'patient': patient_name,
+            'service': service_name,
+            'care_unit': care_unit_name,
+            'operator': operator_name,
+            'time': time_slot
+        })
+
+    # every window without a scheduled day inside is rejected
+    rejected = []
+    for patient_name, service_name, window_start, window_end in sorted(windows):
+        scheduled_days = scheduled_days_per_request.get((patient_name, service_name), [])
+        if not any(day >= window_start and day <= window_end for day in scheduled_days):
+            rejected.append({
+                'patient': patient_name,
+                'service': service_name,
+                'window': [window_start, window_end]
+            })
+
+    scheduled = dict(sorted(scheduled.items(), key=lambda v: int(v[0])))
+    for daily_schedule in scheduled.values():
+        daily_schedule.sort(key=lambda v: (v['patient'], v['service'], v['care_unit'], v['operator'], v['time']))
+
+    return {
+        'scheduled': scheduled,
+        'rejected': rejected
+    }
+
+
+def set_monolitic_model_start(instance, model: pyo.ConcreteModel, schedule) -> None:
+    """
+    This function loads a schedule (in the final results format) as the
+    starting values of the 'window', 'do' and 'time' (or 'start') variables of
+    a monolitic model. Auxiliary variables are left to the solver to be
+    completed.
+    Interchangeable operators are renamed in order to respect the symmetry
+    breaking constraints of the model.
+    """
+
+    schedule = {'scheduled': {day_name: [item.copy() for item in daily_schedule] for day_name, daily_schedule in schedule['scheduled'].items()}}
+
+    for day_name, daily_schedule in schedule['scheduled'].items():
+        for care_unit_name, care_unit in instance['days'][day_name].items():
+            for operator_names in get_operator_equivalence_classes(care_unit):
+
+                # total duration of the services done by each operator of the class
+                operator_loads = {operator_name: 0 for operator_name in operator_names}
+                for item in daily_schedule:
+                    if item['care_unit'] == care_unit_name and item['operator'] in operator_loads:
+                        operator_loads[item['operator']] += instance['services'][item['service']]['duration']
+
+                # operators are renamed in order of decreasing load
+                sorted_operator_names = sorted(operator_names, key=lambda o: -operator_loads[o])
+                new_operator_names = dict(zip(sorted_operator_names, operator_names))
+                for item in daily_schedule:
+                    if item['care_unit'] == care_unit_name and item['operator'] in new_operator_names:
+                        item['operator'] = new_operator_names[item['operator']]
+
+    use_time_indexed_formulation = hasattr(model, 'start')
+
+    for index in model.do_index:
+        model.do[index].value = 0
+    for index in model.window_index:
+        model.window[index].value = 0
+        if not use_time_indexed_formulation:
+            model.time[index].value = 0
+    if use_time_indexed_formulation:
+        for index in model.start_index:
+            model.start[index].value = 0
+
+    # window bounds of each request, in 'window_index' order
+    windows_per_request = {}
+    for p, s, ws, we in model.window_index:
+        if (p, s) not in windows_per_request:
+            windows_per_request[(p, s)] = []
+        windows_per_request[(p, s)].append((ws, we))
+
+    for day_name, daily_schedule in schedule['scheduled'].items():
+        day = int(day_name)
+        for item in daily_schedule:
+            p, s, c, o = item['patient'], item['service'], item['care_unit'], item['operator']
+
+            if (p, s, day, c, o) not in model.do_index:
+                continue
+            model.do[p, s, day, c, o].value = 1
+            if use_time_indexed_formulation:
+                model.start[p, s, day, c, o, item['time']].value = 1
+
+            # every window containing the day is satisfied by this assignment
+            for ws, we in windows_per_request.get((p, s), []):
+                if day >= ws and day <= we:
+                    model.window[p, s, ws, we].value = 1
+                    if not use_time_indexed_formulation:
+                        model.time[p, s, ws, we].value = item['time'] + 1
+
+
+def get_monolitic_model(instance, use_inefficient_operators, use_time_indexed_formulation=False) -> pyo.ConcreteModel:
+
+    # the time-indexed formulation has no 'time' variables to be linked to operators
+    use_inefficient_operators = use_inefficient_operators and not use_time_indexed_formulation
 
     max_day_number = max([int(d) for d in instance['days'].keys()])
 
@@ -101,27 +450,7 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
 
     # this variable stores a set of quadruples (patient, service, start, end) for
     # each interval requested by some protocol
-    windows = set()
-
-    # unravel each protocol service
-    for patient_name, patient in instance['patients'].items():
-        for protocol_name, protocol in patient['protocols'].items():
-            for protocol_service in protocol['protocol_services']:
-
-                day = protocol_service['start'] + protocol['initial_shift']
-                service_name = protocol_service['service']
-                tolerance = protocol_service['tolerance']
-                frequency = protocol_service['frequency']
-
-                # generate times interval
-                for time in range(protocol_service['times']):
-
-                    window_start, window_end = clamp(day - tolerance, day + tolerance, 0, max_day_number)
-                    
-                    if window_start is not None and window_end is not None:
-                        windows.add((patient_name, service_name, window_start, window_end))
-                    
-                    day += frequency
+    windows = get_request_windows(instance, max_day_number)
 
     # this set contains all (patient, service, day, care_unit, operator) tuples for
     # each possible protocol assignment. Those will be the indexes of actual
@@ -152,25 +481,42 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # This tuples will indicize all overlap constraints between same patient and same operator.
     overlap_tuples = set()
 
-    for patient_name_1, service_name_1, day_1, care_unit_name_1, operator_name_1 in schedulable_tuples_with_operators:
-        for patient_name_2, service_name_2, day_2, care_unit_name_2, operator_name_2 in schedulable_tuples_with_operators:
-            # day and care unit must be the same in order to have a meaningful overlap
-            if day_1 != day_2:
-                continue
-            
-            # at least one between patients and operators must be the same
-            if patient_name_1 != patient_name_2 and (operator_name_1 != operator_name_2 or care_unit_name_1 != care_unit_name_2):
-                continue
+    # the time-indexed formulation doesn't need them: overlaps are avoided by
+    # capacity constraints on each time slot
+    if not use_time_indexed_formulation:
 
-            # discarding indexes referred to the same request
-            if patient_name_1 == patient_name_2 and service_name_1 == service_name_2:
-                continue
-            
-            # simmetry check
-            if service_name_1 > service_name_2 or (patient_name_1 > patient_name_2 and service_name_1 == service_name_2) or (operator_name_1 >= operator_name_2 and patient_name_1 == patient_name_2 and service_name_1 == service_name_2):
-                continue
+        # two tuples can overlap only if they share the day and at least one
+        # between patient and operator: group them by (day, patient) and by
+        # (day, care_unit, operator) so that only those couples are compared
+        schedulable_tuples_per_patient = {}
+        schedulable_tuples_per_operator = {}
 
-            overlap_tuples.add((patient_name_1, service_name_1, patient_name_2, service_name_2, day_1, care_unit_name_1, operator_name_1, care_unit_name_2, operator_name_2))
+        for schedulable_tuple in schedulable_tuples_with_operators:
+            patient_name, service_name, day, care_unit_name, operator_name = schedulable_tuple
+
+            if (day, patient_name) not in schedulable_tuples_per_patient:
+                schedulable_tuples_per_patient[(day, patient_name)] = []
+            schedulable_tuples_per_patient[(day, patient_name)].append(schedulable_tuple)
+
+            if (day, care_unit_name, operator_name) not in schedulable_tuples_per_operator:
+                schedulable_tuples_per_operator[(day, care_unit_name, operator_name)] = []
+            schedulable_tuples_per_operator[(day, care_unit_name, operator_name)].append(schedulable_tuple)
+
+        for schedulable_tuples in [*schedulable_tuples_per_patient.values(), *schedulable_tuples_per_operator.values()]:
+            for patient_name_1, service_name_1, day_1, care_unit_name_1, operator_name_1 in schedulable_tuples:
+                for patient_name_2, service_name_2, day_2, care_unit_name_2, operator_name_2 in schedulable_tuples:
+
+                    # discarding indexes referred to the same request
+                    if patient_name_1 == patient_name_2 and service_name_1 == service_name_2:
+                        continue
+                
+                    # simmetry check
+                    if service_name_1 > service_name_2 or (patient_name_1 > patient_name_2 and service_name_1 == service_name_2):
+                        continue
+
+                    overlap_tuples.add((patient_name_1, service_name_1, patient_name_2, service_name_2, day_1, care_unit_name_1, operator_name_1, care_unit_name_2, operator_name_2))
+
+        del schedulable_tuples_per_patient, schedulable_tuples_per_operator
 
     model.window_index = pyo.Set(initialize=sorted(windows))
     model.do_index = pyo.Set(initialize=sorted(schedulable_tuples_with_operators))
@@ -179,28 +525,32 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     model.overlap_index = pyo.Set(initialize=sorted(overlap_tuples))
     del windows, schedulable_tuples_with_operators, overlap_tuples
 
+    # window bounds (start, end) grouped by (patient, service)
+    windows_per_request = {}
+    for patient_name, service_name, window_start, window_end in model.window_index:
+        if (patient_name, service_name) not in windows_per_request:
+            windows_per_request[(patient_name, service_name)] = []
+        windows_per_request[(patient_name, service_name)].append((window_start, window_end))
+
     # set of all windows of the same patient and service that intersect eachother.
     # (patient, service1, service2, start1, end1, start2, end2)
     window_overlaps = set()
 
-    for patient_name_1, service_name_1, window_start_1, window_end_1 in model.window_index:
-        for patient_name_2, service_name_2, window_start_2, window_end_2 in model.window_index:
-
-            # valid only windows of the same patient and service
-            if patient_name_1 != patient_name_2 or service_name_1 != service_name_2:
-                continue
+    for (patient_name, service_name), request_windows in windows_per_request.items():
+        for window_start_1, window_end_1 in request_windows:
+            for window_start_2, window_end_2 in request_windows:
 
-            # not the same window of course
-            if window_start_1 == window_start_2 and window_end_1 == window_end_2:
-                continue
+                # not the same window of course
+                if window_start_1 == window_start_2 and window_end_1 == window_end_2:
+                    continue
 
-            # symmetry check
-            if window_start_1 > window_start_2:
-                continue
+                # symmetry check
+                if window_start_1 > window_start_2:
+                    continue
 
-            if ((window_end_1 >= window_start_2 and window_end_1 <= window_end_2) or
-                (window_end_2 >= window_start_1 and window_end_2 <= window_end_1)):
-                window_overlaps.add((patient_name_1, service_name_1, window_start_1, window_end_1, window_start_2, window_end_2))
+                if ((window_end_1 >= window_start_2 and window_end_1 <= window_end_2) or
+                    (window_end_2 >= window_start_1 and window_end_2 <= window_end_1)):
+                    window_overlaps.add((patient_name, service_name, window_start_1, window_end_1, window_start_2, window_end_2))
 
     model.window_overlap_index = pyo.Set(initialize=sorted(window_overlaps))
     del window_overlaps
@@ -233,6 +583,79 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
         
         return (min_operator_start - 1, max_operator_end - service_duration)
 
+    # 'do' indexes grouped in a single pass by (patient, service), by
+    # (patient, day) and by (day, care_unit, operator). Constraint rules look
+    # them up instead of scanning the whole 'do_index' for every row. Each
+    # group keeps the sorted order of 'do_index'.
+    do_indexes_per_request = {}
+    do_indexes_per_patient_day = {}
+    do_indexes_per_operator = {}
+
+    for do_index in model.do_index:
+        p, s, d, c, o = do_index
+
+        if (p, s) not in do_indexes_per_request:
+            do_indexes_per_request[(p, s)] = []
+        do_indexes_per_request[(p, s)].append(do_index)
+
+        if (p, d) not in do_indexes_per_patient_day:
+            do_indexes_per_patient_day[(p, d)] = []
+        do_indexes_per_patient_day[(p, d)].append(do_index)
+
+        if (d, c, o) not in do_indexes_per_operator:
+            do_indexes_per_operator[(d, c, o)] = []
+        do_indexes_per_operator[(d, c, o)].append(do_index)
+
+    # interchangeable operators (same start and duration in the same day and
+    # care unit) make the model symmetric. This set contains the tuples
+    # (day, care_unit, operator, previous_operator) for each operator with a
+    # previous one in its equivalence class
+    operator_symmetry_tuples = []
+    for d, c in model.care_units:
+        for operator_names in get_operator_equivalence_classes(instance['days'][str(d)][c]):
+            for index in range(1, len(operator_names)):
+                operator_symmetry_tuples.append((d, c, operator_names[index], operator_names[index - 1]))
+
+    model.operator_symmetry_index = pyo.Set(initialize=operator_symmetry_tuples)
+    del operator_symmetry_tuples
+
+    if use_time_indexed_formulation:
+
+        # (patient, service, day, care_unit, operator, time_slot) for each time
+        # slot in which the service can start and be completed by the operator
+        start_tuples = []
+        start_time_slots_per_do_index = {}
+
+        # start tuples that occupy each time slot of an operator
+        # (day, care_unit, operator, time_slot) and of a patient (patient, day, time_slot)
+        start_indexes_per_operator_time_slot = {}
+        start_indexes_per_patient_time_slot = {}
+
+        for p, s, d, c, o in model.do_index:
+            operator = instance['days'][str(d)][c][o]
+            service_duration = instance['services'][s]['duration']
+            start_time_slots_per_do_index[p, s, d, c, o] = []
+
+            for t in range(operator['start'], operator['start'] + operator['duration'] - service_duration + 1):
+                start_tuple = (p, s, d, c, o, t)
+                start_tuples.append(start_tuple)
+                start_time_slots_per_do_index[p, s, d, c, o].append(t)
+
+                for time_slot in range(t, t + service_duration):
+                    if (d, c, o, time_slot) not in start_indexes_per_operator_time_slot:
+                        start_indexes_per_operator_time_slot[(d, c, o, time_slot)] = []
+                    start_indexes_per_operator_time_slot[(d, c, o, time_slot)].append(start_tuple)
+                    if (p, d, time_slot) not in start_indexes_per_patient_time_slot:
+                        start_indexes_per_patient_time_slot[(p, d, time_slot)] = []
+                    start_indexes_per_patient_time_slot[(p, d, time_slot)].append(start_tuple)
+
+        model.start_index = pyo.Set(initialize=start_tuples)
+
+        # only time slots contended by more than one start tuple need a constraint
+        model.operator_time_slot_index = pyo.Set(initialize=sorted(k for k, v in start_indexes_per_operator_time_slot.items() if len(v) > 1))
+        model.patient_time_slot_index = pyo.Set(initialize=sorted(k for k, v in start_indexes_per_patient_time_slot.items() if len(v) > 1))
+        del start_tuples
+
     ############################# VARIABLES DEFINITION #############################
 
     # decision variables that describe if a request window is satisfied.
@@ -242,7 +665,15 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # if a 'window' variable is equal to 1 then its corresponding
     # 'time' variable specify in which time slot the request is satisfied.
     # Its index is (patient, service, window_start, window_end)
-    model.time = pyo.Var(model.window_index, domain=pyo.NonNegativeIntegers, bounds=get_time_bounds)
+    if not use_time_indexed_formulation:
+        model.time = pyo.Var(model.window_index, domain=pyo.NonNegativeIntegers, bounds=get_time_bounds)
+
+    # in the time-indexed formulation a 'start' variable is equal to 1 if the
+    # request is satisfied in that day, by that operator and starting at that
+    # time slot.
+    # Its index is (patient, service, day, care_unit, operator, time_slot)
+    else:
+        model.start = pyo.Var(model.start_index, domain=pyo.Binary)
 
     # decision variables that describe what request is satisfied in which day and
     # by which operator.
@@ -268,9 +699,27 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # equal to 0).
     @model.Constraint(model.window_index)
     def link_window_to_do_variables(model, p, s, ws, we):
-        return pyo.quicksum([model.do[pp, ss, d, c, o] for pp, ss, d, c, o in model.do_index if p == pp and s == ss and d >= ws and d <= we and c == model.service_care_unit[s]]) == model.window[p, s, ws, we]
+        return pyo.quicksum([model.do[pp, ss, d, c, o] for pp, ss, d, c, o in do_indexes_per_request.get((p, s), []) if d >= ws and d <= we and c == model.service_care_unit[s]]) == model.window[p, s, ws, we]
+
+    if use_time_indexed_formulation:
+
+        # a 'do' variable is 1 if and only if the request starts in exactly one
+        # time slot of that operator
+        @model.Constraint(model.do_index)
+        def link_do_to_start_variables(model, p, s, d, c, o):
+            return pyo.quicksum(model.start[p, s, d, c, o, t] for t in start_time_slots_per_do_index[p, s, d, c, o]) == model.do[p, s, d, c, o]
 
-    if not use_inefficient_operators:
+        # an operator can't do more than one service in each time slot
+        @model.Constraint(model.operator_time_slot_index)
+        def operator_time_slot_capacity(model, d, c, o, t):
+            return pyo.quicksum(model.start[start_index] for start_index in start_indexes_per_operator_time_slot[d, c, o, t]) <= 1
+
+        # a patient can't receive more than one service in each time slot
+        @model.Constraint(model.patient_time_slot_index)
+        def patient_time_slot_capacity(model, p, d, t):
+            return pyo.quicksum(model.start[start_index] for start_index in start_indexes_per_patient_time_slot[p, d, t]) <= 1
+
+    elif not use_inefficient_operators:
 
         # constraint that describes the implications:
         # (t[p,s,ws,we] > 0) -> (w[p,s,ws,we] = 1)
@@ -306,11 +755,11 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # (p, s, pp, ss, d, c, o, oo, ws, we, wws, wwe)
     overlap_constraint_index = set()
     for p, s, pp, ss, d, c, o, cc, oo in model.overlap_index:
-        for ppp, sss, ws, we in model.window_index:
-            if p != ppp or s != sss or we < d or ws > d:
+        for ws, we in windows_per_request[(p, s)]:
+            if we < d or ws > d:
                 continue
-            for pppp, ssss, wws, wwe in model.window_index:
-                if pp != pppp or ss != ssss or wwe < d or wws > d:
+            for wws, wwe in windows_per_request[(pp, ss)]:
+                if wwe < d or wws > d:
                     continue
                 overlap_constraint_index.add((p, s, pp, ss, d, c, o, cc, oo, ws, we, wws, wwe))
     model.overlap_constraint_index = pyo.Set(initialize=sorted(overlap_constraint_index))
@@ -363,7 +812,7 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # This constraint could be omitted without loss of correctedness but helps with a faster convergence.
     @model.Constraint(model.patients_days)
     def redundant_patient_cut(model, p, d):
-        tuples_affected = [(s, c, o) for pp, s, dd, c, o in model.do_index if p == pp and d == dd]
+        tuples_affected = [(s, c, o) for pp, s, dd, c, o in do_indexes_per_patient_day.get((p, d), [])]
         if len(tuples_affected) == 0:
             return pyo.Constraint.Feasible
         involved_care_unit_names = set(tuples_affected[i][1] for i in range(len(tuples_affected)))
@@ -375,7 +824,7 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     # without loss of correctedness but helps with a faster convergence.
     @model.Constraint(model.operators)
     def redundant_operator_cut(model, d, c, o):
-        tuples_affected = [(p, s) for p, s, dd, cc, oo in model.do_index if d == dd and cc == c and oo == o]
+        tuples_affected = [(p, s) for p, s, dd, cc, oo in do_indexes_per_operator.get((d, c, o), [])]
         if len(tuples_affected) == 0:
             return pyo.Constraint.Feasible
         return pyo.quicksum(model.do[p, s, d, c, o] * model.service_duration[s] for p, s in tuples_affected) <= model.operator_duration[d, c, o]
@@ -387,9 +836,22 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
     def window_overlap_constraint(model, p, s, ws, we, wws, wwe):
         min_ws = min(ws, wws)
         max_we = max(we, wwe)
-        tuples_affected = [(p, s, d, c, o) for d in range(min_ws, max_we + 1) for pp, ss, dd, c, o in model.do_index if p == pp and s == ss and d == dd]
+        tuples_affected = [(p, s, d, c, o) for pp, ss, d, c, o in do_indexes_per_request.get((p, s), []) if d >= min_ws and d <= max_we]
         return pyo.quicksum(model.do[p, s, d, c, o] for p, s, d, c, o in tuples_affected) <= 1 + model.window_overlap[p, s, ws, we, wws, wwe]
 
+    # *optional* symmetry breaking constraint. Interchangeable operators are
+    # ordered by their load: the total duration of the services done by an
+    # operator can't exceed the one of the previous operator of its class.
+    # Any solution can be relabeled to respect it.
+    @model.Constraint(model.operator_symmetry_index)
+    def operator_symmetry_constraint(model, d, c, o, oo):
+        tuples_affected = do_indexes_per_operator.get((d, c, o), [])
+        previous_tuples_affected = do_indexes_per_operator.get((d, c, oo), [])
+        if len(tuples_affected) == 0:
+            return pyo.Constraint.Feasible
+        return (pyo.quicksum(model.do[p, s, d, c, o] * model.service_duration[s] for p, s, dd, cc, ooo in tuples_affected) <=
+                pyo.quicksum(model.do[p, s, d, c, oo] * model.service_duration[s] for p, s, dd, cc, ooo in previous_tuples_affected))
+
     ############################## OBJECTIVE FUNCTION ##############################
 
     # the solution value depends linearly by the total service duration of the
@@ -411,21 +873,56 @@ def get_monolitic_model(instance, use_inefficient_operators) -> pyo.ConcreteMode
 
 def get_results_from_monolitic_model(model):
 
+    # read all solution values in bulk, once per variable
+    window_values = model.window.extract_values()
+    do_values = model.do.extract_values()
+
+    # the time-indexed formulation has the time slot of each (day, care_unit, operator)
+    # instead of one for each window
+    use_time_indexed_formulation = hasattr(model, 'start')
+    if use_time_indexed_formulation:
+        time_slots_per_do_index = {}
+        for (p, s, d, c, o, t), start_value in model.start.extract_values().items():
+            if start_value is not None and start_value > 0.5:
+                time_slots_per_do_index[p, s, d, c, o] = t
+    else:
+        time_values = model.time.extract_values()
+
+    # window bounds of each request, in 'window_index' order
+    windows_per_request = {}
+    for p, s, ws, we in model.window_index:
+        if (p, s) not in windows_per_request:
+            windows_per_request[(p, s)] = []
+        windows_per_request[(p, s)].append((ws, we))
+
+    # satisfied (day, care_unit, operator) of each request, in 'do_index' order
+    done_per_request = {}
+    for (p, s, d, c, o), do_value in do_values.items():
+        if do_value < 0.5:
+            continue
+        if (p, s) not in done_per_request:
+            done_per_request[(p, s)] = []
+        done_per_request[(p, s)].append((d, c, o))
+
     results_grouped_per_day = {}
     for p, s, ws, we in model.window_index:
-        if pyo.value(model.window[p, s, ws, we]) < 0.5:
+        if window_values[p, s, ws, we] < 0.5:
             continue
-        for pp, ss, d, c, o in model.do_index:
-            if p != pp or s != ss or int(d) < ws or int(d) > we:
-                continue
-            if pyo.value(model.do[p, s, d, c, o]) < 0.5:
+        for d, c, o in done_per_request.get((p, s), []):
+            if int(d) < ws or int(d) > we:
                 continue
             day_name = str(d)
+
+            # the time slot is the one of the first window containing that day
             time_slot = None
-            for pp, ss, ws, we in model.window_index:
-                if p == pp and s == ss and d >= ws and d <= we:
-                    time_slot = int(pyo.value(model.time[p, s, ws, we]) - 1)
-                    break
+            if use_time_indexed_formulation:
+                time_slot = time_slots_per_do_index.get((p, s, d, c, o))
+            else:
+                for wws, wwe in windows_per_request[(p, s)]:
+                    if d >= wws and d <= wwe:
+                        time_slot = int(time_values[p, s, wws, wwe] - 1)
+                        break
+
             if day_name not in results_grouped_per_day:
                 results_grouped_per_day[day_name] = []
             results_grouped_per_day[day_name].append({
@@ -438,7 +935,7 @@ def get_results_from_monolitic_model(model):
 
     rejected_requests = []
     for p, s, ws, we in model.window_index:
-        if pyo.value(model.window[p, s, ws, we]) < 0.5:
+        if window_values[p, s, ws, we] < 0.5:
             rejected_requests.append({
                 'patient': p,
                 'service': s,
@@ -0,0 +1,118 @@
+from argparse import ArgumentParser
+from pathlib import Path
+import csv
+
+from main import solve_problem
+from json_tools import read_json
+
+
+def get_subproblem_input(instance):
+
+    # generator subproblem instances have a list of requests and a single 'day',
+    # the main loop subproblems have the requests grouped by patient
+    requests = {}
+    for request in instance['requests']:
+        if request['patient'] not in requests:
+            requests[request['patient']] = []
+        requests[request['patient']].append(request['service'])
+
+    priorities = instance.get('patient_priorities', {})
+
+    return {
+        'operators': instance['day'],
+        'services': instance['services'],
+        'requests': requests,
+        'priorities': {patient_name: priorities.get(patient_name, 1) for patient_name in requests.keys()}
+    }
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(prog='subproblem_benchmark.py', description='Compare the big-M and time-indexed subproblem formulations')
+    parser.add_argument('-i', '--input', type=Path, required=True, help='Folder with the generated subproblem instance groups.')
+    parser.add_argument('-t', '--time-limit', type=int, default=60, help='Time limit in seconds for each solve.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    input_folder_path = Path(args.input).resolve()
+
+    # the folder can be a single group or contain more group folders
+    group_paths = [path for path in sorted(input_folder_path.iterdir()) if path.is_dir()]
+    if len(group_paths) == 0:
+        group_paths = [input_folder_path]
+
+    formulations = ['big-m', 'time-indexed']
+    benchmark_data = []
+
+    for group_path in group_paths:
+        for instance_path in sorted(group_path.iterdir()):
+
+            # the only valid files are JSON that don't start with 'SOL_'
+            if not instance_path.is_file() or instance_path.suffix != '.json':
+                continue
+            if instance_path.name.startswith('SOL_') or instance_path.name == 'info.json':
+                continue
+
+            instance = read_json(instance_path)
+
+            # only subproblem instances are considered
+            if 'day' not in instance:
+                continue
+
+            subproblem_input = get_subproblem_input(instance)
+
+            for formulation in formulations:
+
+                subproblem_results, solver_info = solve_problem(
+                    instance=subproblem_input,
+                    output_folder_path=group_path,
+                    time_limit=args.time_limit,
+                    log_file_name=f'{instance_path.stem}_{formulation}.log',
+                    tee=False,
+                    formulation=formulation
+                )
+
+                benchmark_data.append({
+                    'group': group_path.name,
+                    'instance': instance_path.name,
+                    'formulation': formulation,
+                    'model_creation_time': solver_info['model_creation_time'],
+                    'model_solving_time': solver_info['model_solving_time'],
+                    'solver_internal_time': solver_info['solver_internal_time'],
+                    'termination_condition': solver_info['termination_condition'],
+                    'gap': solver_info['gap'],
+                    'objective_function_value': solver_info['objective_function_value']
+                })
+
+                if args.verbose:
+                    print(f'{instance_path} {formulation}: value {solver_info["objective_function_value"]}, '
+                          f'{solver_info["termination_condition"]} in {solver_info["model_solving_time"]} seconds.')
+
+    field_names = [
+        'group',
+        'instance',
+        'formulation',
+        'model_creation_time',
+        'model_solving_time',
+        'solver_internal_time',
+        'termination_condition',
+        'gap',
+        'objective_function_value'
+    ]
+
+    # write all the solves to a csv file
+    with open(input_folder_path.joinpath('subproblem_benchmark.csv'), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=field_names, dialect='excel-tab')
+        writer.writeheader()
+        writer.writerows(benchmark_data)
+
+    # average times of each formulation
+    for formulation in formulations:
+        formulation_data = [data for data in benchmark_data if data['formulation'] == formulation]
+        if len(formulation_data) == 0:
+            continue
+        creation_time = sum(data['model_creation_time'] for data in formulation_data) / len(formulation_data)
+        solving_time = sum(data['model_solving_time'] for data in formulation_data) / len(formulation_data)
+        optimal_number = len([data for data in formulation_data if data['termination_condition'] == 'optimal'])
+        print(f'{formulation}: {len(formulation_data)} instances, {optimal_number} optimal, '
+              f'average creation time {creation_time:.3f} s, average solving time {solving_time:.3f} s')
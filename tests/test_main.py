@@ -0,0 +1,124 @@
+import sys
+import random
+from pathlib import Path
+
+import pytest
+import pyomo.environ as pyo
+
+# shared modules are in the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from main import compute_cores, solve_problem, solve_heuristic_problem
+from generator.tools import generate_master_instance, get_compact_instance
+from solvers.tools import get_request_windows
+from checkers.tools import find_results_errors
+from json_tools import read_json, write_json, get_expanded_instance
+
+
+def get_config(patient_number, day_number=5):
+
+    # small days, so that the subproblems fit a size-limited solver license
+    return {
+        'day': {'strategy': 'repeat_week', 'week_size': 5, 'number': day_number, 'time_slots': 32, 'care_unit_number': 2, 'operators_per_care_unit': 2},
+        'operator': {'strategy': 'overlap', 'duration': 16, 'overlap_percentage': 0.5},
+        'service': {'strategy': 'pool', 'care_unit_strategy': 'balanced', 'pool_size': 10, 'duration': {'min': 1, 'max': 8}},
+        'patient': {'number': patient_number, 'use_priority': True, 'priority': {'min': 1, 'max': 3}, 'protocols_per_patient': {'min': 1, 'max': 3, 'average': 1, 'standard_deviation': 0.1}},
+        'protocol': {
+            'strategy': 'all_different',
+            'services_per_protocol': 3,
+            'initial_shift_spread_percentage': 0.5,
+            'service': {'start_spread_percentage': 1.0, 'tolerance': {'max': 2}, 'frequency': {'average': 6, 'standard_deviation': 3.0}, 'times': {'max': 4}}
+        }
+    }
+
+
+def get_instance(patient_number, seed, day_number=5):
+    random.seed(seed)
+    return generate_master_instance(get_config(patient_number, day_number))
+
+
+def get_subproblem_input(instance, day_name, requests=None):
+
+    # by default every request with a window containing the day is asked in
+    # that day, so that the day is overloaded
+    if requests is None:
+        requests = {}
+        for patient_name, service_name, window_start, window_end in get_request_windows(instance, len(instance['days']) - 1):
+            if window_start <= int(day_name) <= window_end:
+                if patient_name not in requests:
+                    requests[patient_name] = set()
+                requests[patient_name].add(service_name)
+
+    return {
+        'operators': instance['days'][day_name],
+        'services': instance['services'],
+        'requests': {patient_name: sorted(service_names) for patient_name, service_names in sorted(requests.items())},
+        'priorities': {patient_name: patient['priority'] for patient_name, patient in instance['patients'].items()}
+    }
+
+
+def is_gurobi_available():
+    return pyo.SolverFactory('gurobi').available(exception_flag=False)
+
+
+@pytest.mark.skipif(not is_gurobi_available(), reason='gurobi is not available')
+def test_cores_are_infeasible(tmp_path):
+
+    instance = get_instance(patient_number=10, seed=0)
+
+    cores = []
+    for day_name in ['1', '3']:
+        subproblem_input = get_subproblem_input(instance, day_name)
+        subproblem_results, solver_info = solve_problem(subproblem_input, tmp_path, None, tee=False)
+        assert solver_info['termination_condition'] == 'optimal'
+        assert len(subproblem_results['rejected']) > 0
+        cores.extend(compute_cores(instance, {day_name: subproblem_input['requests']}, {day_name: subproblem_results}, {day_name: solver_info}))
+
+    assert len(cores) > 0
+
+    # a valid no-good cut: the requests of a core can't be all satisfied in its day
+    for core in cores:
+        core_requests = {}
+        for patient_name, service_name in core['components']:
+            if patient_name not in core_requests:
+                core_requests[patient_name] = set()
+            core_requests[patient_name].add(service_name)
+
+        for day_name in core['days']:
+            core_results, solver_info = solve_problem(get_subproblem_input(instance, day_name, core_requests), tmp_path, None, tee=False)
+            assert solver_info['termination_condition'] == 'optimal'
+            assert len(core_results['rejected']) > 0
+
+
+def test_heuristic_results_are_valid():
+
+    for seed in range(5):
+
+        instance = get_instance(patient_number=10, seed=seed)
+
+        results = {'scheduled': {}, 'rejected': []}
+        for day_name in instance['days'].keys():
+            subproblem_results, solver_info = solve_heuristic_problem(get_subproblem_input(instance, day_name))
+            results['scheduled'][day_name] = subproblem_results['scheduled']
+
+            # a request is either scheduled or rejected, never both
+            scheduled_requests = {(item['patient'], item['service']) for item in subproblem_results['scheduled']}
+            for patient_name, service_names in subproblem_results['rejected'].items():
+                for service_name in service_names:
+                    assert (patient_name, service_name) not in scheduled_requests
+
+        assert list(find_results_errors(results, instance)) == []
+
+
+def test_compact_instance_round_trip(tmp_path):
+
+    for seed in range(5):
+
+        instance = get_instance(patient_number=5, seed=seed, day_number=12)
+        compact_instance = get_compact_instance(instance)
+
+        assert len(compact_instance['day_templates']) <= 5
+        assert get_expanded_instance(compact_instance) == instance
+
+        # the same after being written on file
+        write_json(tmp_path.joinpath('instance.json'), compact_instance, compact=True)
+        assert get_expanded_instance(read_json(tmp_path.joinpath('instance.json'))) == instance